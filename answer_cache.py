@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from telemetry import metrics
+from config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Singleton cache shared by every workflow run in the process
+_answer_cache = None
+
+class SemanticAnswerCache:
+    """
+    Answer cache looked up by nearest neighbour over question embeddings.
+
+    An entry is a hit when its question vector has cosine similarity >= `threshold` with the new
+    question, it was stored for the same corpus at its current version and it is younger than `ttl`
+    seconds. Entries for older versions of a corpus are dropped on lookup; other corpora's entries
+    are left alone. Entries are evicted least-recently-used beyond `max_entries`.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._corpora = []  # corpus of each matrix row
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _rebuild_matrix(self):
+        self._keys = list(self._entries)
+        self._corpora = [self._entries[k]["corpus"] for k in self._keys]
+        self._matrix = np.stack([self._entries[k]["vector"] for k in self._keys]) if self._keys else None
+
+    def _evict(self, key):
+        del self._entries[key]
+        self._matrix = None
+
+    def _is_stale(self, entry, now, corpus, corpus_version):
+        if now - entry["created_at"] > self.ttl:
+            return True
+        return entry["corpus"] == corpus and entry["corpus_version"] != corpus_version
+
+    def lookup(self, question_vector, corpus_version, corpus=None):
+        """Return (result, similarity) for the closest valid cached answer, or (None, best similarity)."""
+        start = time.perf_counter()
+        with self._lock:
+            now = time.time()
+            for key in [k for k, e in self._entries.items() if self._is_stale(e, now, corpus, corpus_version)]:
+                self._evict(key)
+            if self._matrix is None:
+                self._rebuild_matrix()
+
+            result, best = None, 0.0
+            rows = [i for i, c in enumerate(self._corpora) if c == corpus] if self._matrix is not None else []
+            if rows:
+                similarities = self._matrix[rows] @ self._normalize(question_vector)
+                j = int(np.argmax(similarities))
+                best, i = float(similarities[j]), rows[j]
+                if best >= self.threshold:
+                    key = self._keys[i]
+                    self._entries.move_to_end(key)
+                    result = self._entries[key]["result"]
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            elapsed = time.perf_counter() - start
+            self.lookup_seconds += elapsed
+        metrics.incr("rag_answer_cache_lookups_total", labels={"result": "miss" if result is None else "hit"},
+                     help_text="Semantic answer cache lookups")
+        metrics.observe("rag_answer_cache_lookup_seconds", elapsed, help_text="Semantic answer cache lookup time")
+        return result, best
+
+    def store(self, question_vector, corpus_version, result, corpus=None):
+        """Cache a workflow result for this question vector and corpus version."""
+        with self._lock:
+            self._entries[self._next_key] = {
+                "vector": self._normalize(question_vector),
+                "corpus": corpus,
+                "corpus_version": corpus_version,
+                "created_at": time.time(),
+                "result": result,
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        """Return hit/miss counters, hit rate and mean lookup latency."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": 1000 * self.lookup_seconds / lookups if lookups else 0.0,
+        }
+
+def get_answer_cache():
+    """Return the process-wide semantic answer cache."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache()
+        logger.info("Semantic answer cache initialized")
+    return _answer_cache
@@ -0,0 +1,140 @@
+"""
+Run a JSONL file of questions through the workflow.
+
+Each input line is {"question": ..., "id": optional, "urls": optional list}. Identical questions
+(after normalization, on the same URL set) run once, query embeddings are computed in batches
+ahead of the workers, and one result line per input line is written as soon as its run finishes:
+
+    python batch.py questions.jsonl -o results.jsonl --concurrency 16
+"""
+__import__('pysqlite3')
+import sys
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+import json
+import time
+import asyncio
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from graph import arun_workflow
+from corpus_manager import get_collection_manager
+from router import normalize_question
+from utils import get_embeddings
+from config import BATCH_CONCURRENCY, EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+def read_questions(path):
+    """Read question records from a JSONL file, numbering lines without an `id`."""
+    records = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault("id", line_number)
+            records.append(record)
+    return records
+
+def group_questions(records, urls=None):
+    """Group records that ask the same normalized question on the same URL set; order of first appearance."""
+    groups = OrderedDict()
+    for record in records:
+        record_urls = record.get("urls") or urls
+        key = (normalize_question(record["question"]), tuple(record_urls or ()))
+        groups.setdefault(key, []).append(dict(record, urls=record_urls))
+    return list(groups.values())
+
+def _result_line(record, result, duration, error=None, duplicate_of=None):
+    line = {"id": record["id"], "question": record["question"], "duration_ms": round(duration * 1000, 2)}
+    if duplicate_of is not None:
+        line["duplicate_of"] = duplicate_of
+    if error is not None:
+        line["error"] = error
+        return line
+    trace = result.get("trace") or {}
+    line.update({
+        "generation": result.get("generation"),
+        "status": result.get("status"),
+        "hallucination_grade": result.get("hallucination_grade"),
+        "answer_grade": result.get("answer_grade"),
+        "web_search": result.get("web_search"),
+        "sources": sorted({d.metadata.get("source", "unknown") for d in result.get("documents") or []}),
+        "answer_cache_hit": bool(result.get("answer_cache")),
+        "llm_calls": trace.get("llm_calls"),
+        "nodes": {n["node"]: n["duration_ms"] for n in trace.get("nodes", [])},
+    })
+    return line
+
+async def run_batch(records, output, concurrency=BATCH_CONCURRENCY, urls=None, embed_window=EMBEDDING_BATCH_SIZE * 4):
+    """
+    Answer every record and write one JSON line per record to `output` as runs finish.
+
+    Returns a summary with question counts, errors and throughput.
+    """
+    groups = group_questions(records, urls)
+    loop = asyncio.get_running_loop()
+    # Graph nodes run in the default executor; size it so `concurrency` runs are not starved of threads
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 2 + 4, thread_name_prefix="batch"))
+    embeddings = get_embeddings()
+    slots = asyncio.Semaphore(concurrency)
+    summary = {"questions": len(records), "unique": len(groups), "errors": 0}
+    started = time.perf_counter()
+
+    async def answer(group):
+        first = group[0]
+        start = time.perf_counter()
+        try:
+            # Lease the corpus so runs on other URL sets cannot evict it mid-run; entering may open it from disk
+            lease = get_collection_manager().lease(first["urls"])
+            retriever = await asyncio.to_thread(lease.__enter__)
+            try:
+                result = await arun_workflow({"question": first["question"], "urls": first["urls"]}, retriever=retriever)
+            finally:
+                await asyncio.to_thread(lease.__exit__, None, None, None)
+            error = None
+        except Exception as e:
+            logger.error(f"Question {first['id']} failed: {e}")
+            result, error = None, str(e)
+            summary["errors"] += len(group)
+        finally:
+            slots.release()
+        duration = time.perf_counter() - start
+        for i, record in enumerate(group):
+            line = _result_line(record, result, duration, error, duplicate_of=first["id"] if i else None)
+            output.write(json.dumps(line) + "\n")
+        output.flush()
+
+    tasks = []
+    for window_start in range(0, len(groups), embed_window):
+        window = groups[window_start:window_start + embed_window]
+        # One batched forward pass per window fills the query-vector cache the graph's lookups hit
+        await asyncio.to_thread(embeddings.embed_queries, [g[0]["question"] for g in window])
+        for group in window:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(answer(group)))
+    await asyncio.gather(*tasks)
+
+    wall = time.perf_counter() - started
+    summary.update({"wall_s": round(wall, 2), "questions_per_s": round(len(records) / wall, 2) if wall else None})
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of questions through the RAG workflow")
+    parser.add_argument("input", help="JSONL file with one {\"question\": ...} object per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--urls", nargs="*", help="URL set for questions that do not specify their own")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    records = read_questions(args.input)
+    with open(args.output, "w") as output:
+        summary = asyncio.run(run_batch(records, output, args.concurrency, args.urls or None))
+    print(json.dumps(summary), file=sys.stderr)
+    return summary
+
+if __name__ == "__main__":
+    main()
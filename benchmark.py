@@ -0,0 +1,358 @@
+"""
+Offline benchmark for the RAG workflow.
+
+Runs the real graph, ingestion and retrieval code against deterministic fakes: chat models with
+configurable latency and structured outputs in place of Groq/Gemini, a fake Tavily search tool,
+and synthetic HTML pages served from a local HTTP server. No API keys or internet access needed.
+Also compares the vector backends (Chroma and the compact quantized index) on recall and latency.
+
+    python benchmark.py --pages 10,50 --questions 20 --concurrency 1,4,16 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = {
+    "agents": "agent planning memory reflection tool use task decomposition react autogpt",
+    "prompting": "prompt engineering chain of thought few shot instruction self consistency",
+    "attacks": "adversarial attack jailbreak token manipulation gradient suffix red teaming",
+}
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def _summary(values):
+    return {"p50_ms": round(_percentile(values, 50) * 1000, 2), "p95_ms": round(_percentile(values, 95) * 1000, 2),
+            "mean_ms": round(1000 * sum(values) / len(values), 2) if values else 0.0, "n": len(values)}
+
+def make_page(page_id, paragraphs=12, seed=0):
+    """Return a deterministic synthetic HTML article about one of the topics."""
+    rng = random.Random(f"{seed}-{page_id}")
+    topic = list(TOPICS)[page_id % len(TOPICS)]
+    words = TOPICS[topic].split()
+    body = []
+    for _ in range(paragraphs):
+        sentence = " ".join(rng.choice(words) for _ in range(60))
+        body.append(f"<p>Page {page_id} discusses {topic}. {sentence}.</p>")
+    return (f'<html lang="en"><head><title>{topic} {page_id}</title>'
+            f'<meta name="description" content="Synthetic {topic} page"></head>'
+            f"<body><h1>{topic} {page_id}</h1>{''.join(body)}</body></html>")
+
+def start_fixture_server(page_latency=0.0):
+    """Serve /page/<n> synthetic pages on localhost with an optional per-request delay."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not self.path.startswith("/page/"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            time.sleep(page_latency)
+            body = make_page(int(self.path.rsplit("/", 1)[1])).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", '"' + hashlib.md5(body).hexdigest() + '"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def build_fakes(llm_latency, token_latency, search_latency):
+    """Define fake chat model, embeddings and search tool classes (imported lazily after env setup)."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.embeddings import Embeddings
+    default_latency, default_token_latency = llm_latency, token_latency
+
+    # Structured outputs returned for each schema used by router.py and grader.py
+    structured_values = {
+        "RouteQuery": {"datasource": "vectorstore"},
+        "GradeDocuments": {"binary_score": "yes"},
+        "GradeHallucinations": {"binary_score": "yes"},
+        "GradeAnswer": {"binary_score": "yes"},
+    }
+
+    class FakeChatModel(BaseChatModel):
+        """Deterministic chat model: fixed answer text, fixed latency, word-by-word streaming."""
+        text: str = "Agents combine planning, memory and tool use to solve multi-step tasks."
+        latency: float = default_latency
+        token_latency: float = default_token_latency
+        model_name: str = "fake-llm"
+
+        @property
+        def _llm_type(self):
+            return "fake-chat"
+
+        def _usage(self, messages):
+            prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+            completion_tokens = len(self.text.split())
+            return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens}
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency + self.token_latency * len(self.text.split()))
+            message = AIMessage(content=self.text, usage_metadata=self._usage(messages))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency)
+            words = self.text.split(" ")
+            for i, word in enumerate(words):
+                time.sleep(self.token_latency)
+                content = word if i == len(words) - 1 else word + " "
+                usage = self._usage(messages) if i == len(words) - 1 else None
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=content, usage_metadata=usage))
+                if run_manager:
+                    run_manager.on_llm_new_token(content, chunk=chunk)
+                yield chunk
+
+        def with_structured_output(self, schema, **kwargs):
+            values = structured_values.get(schema.__name__, {})
+            model = FakeChatModel(text=json.dumps(values), latency=self.latency, token_latency=0.0)
+            return model | RunnableLambda(lambda message: schema(**json.loads(message.content)))
+
+    class FakeEmbeddings(Embeddings):
+        """Hashed bag-of-words embeddings: cheap, deterministic, and similar texts get similar vectors."""
+        dim = 384
+
+        def _embed(self, text):
+            vector = [0.0] * self.dim
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+            return vector
+
+        def embed_documents(self, texts):
+            return [self._embed(t) for t in texts]
+
+        def embed_query(self, text):
+            return self._embed(text)
+
+    class FakeSearchTool:
+        """Stand-in for TavilySearch: same invoke() shape, fixed latency, deterministic results."""
+        def invoke(self, payload):
+            time.sleep(search_latency)
+            digest = hashlib.md5(payload["query"].encode("utf-8")).hexdigest()[:8]
+            return {"results": [{"url": f"https://example.com/{digest}/{i}",
+                                 "content": f"Web result {i} about {payload['query']}."} for i in range(3)]}
+
+    return FakeChatModel, FakeEmbeddings, FakeSearchTool
+
+def measure_ingest(base_url, sizes, offset=0):
+    """Ingest fresh corpora of each size into separate indexes; report cold and warm (unchanged) times."""
+    import ingestion
+    from config import DATA_DIR
+    results = []
+    for n, size in enumerate(sizes):
+        urls = [f"{base_url}/page/{offset + n * 100000 + i}" for i in range(size)]
+        directory = os.path.join(DATA_DIR, f"ingest-{size}")
+        tracemalloc.start()
+        start = time.perf_counter()
+        ingestion.initialize_vectorstore(urls=urls, persist_directory=directory)
+        cold = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        ingestion.initialize_vectorstore(urls=urls, persist_directory=directory, refresh=True)
+        warm = time.perf_counter() - start
+        results.append({"pages": size, "cold_s": round(cold, 3), "warm_refresh_s": round(warm, 3),
+                        "peak_traced_mb": round(peak / 2 ** 20, 1)})
+        print(f"ingest {size} pages: cold {cold:.2f}s, warm refresh {warm:.2f}s", file=sys.stderr)
+    return results
+
+def make_questions(count, seed=0):
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        topic = list(TOPICS)[i % len(TOPICS)]
+        words = rng.sample(TOPICS[topic].split(), 3)
+        questions.append(f"Question {i}: how does {' '.join(words)} relate to {topic}?")
+    return questions
+
+def measure_queries(retriever, questions, concurrency_levels):
+    """Run questions through arun_workflow at each concurrency level; collect latency and per-node timings."""
+    from graph import arun_workflow
+
+    async def run(concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, traces = [], []
+
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                result = await arun_workflow({"question": question}, retriever=retriever)
+                latencies.append(time.perf_counter() - start)
+                if result.get("trace"):
+                    traces.append(result["trace"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(f"[c{concurrency}] {q}") for q in questions))
+        return time.perf_counter() - start, latencies, traces
+
+    report = []
+    for concurrency in concurrency_levels:
+        wall, latencies, traces = asyncio.run(run(concurrency))
+        stages = {}
+        for trace in traces:
+            for node in trace["nodes"]:
+                stages.setdefault(node["node"], []).append(node["duration_ms"] / 1000)
+        report.append({
+            "concurrency": concurrency,
+            "questions": len(questions),
+            "throughput_qps": round(len(questions) / wall, 2),
+            "end_to_end": _summary(latencies),
+            "stages": {name: _summary(values) for name, values in stages.items()},
+            "llm_calls_per_question": round(sum(t["llm_calls"] for t in traces) / max(1, len(traces)), 2),
+        })
+        print(f"concurrency {concurrency}: {report[-1]['throughput_qps']} q/s, "
+              f"p95 {report[-1]['end_to_end']['p95_ms']} ms", file=sys.stderr)
+    return report
+
+def make_chunks(count, seed=0):
+    """Synthetic chunk texts drawn from the topic vocabularies, for the index comparison."""
+    rng = random.Random(seed)
+    vocabulary = " ".join(TOPICS.values()).split()
+    return [f"Chunk {i} " + " ".join(rng.choices(vocabulary, k=rng.randint(20, 40))) for i in range(count)]
+
+def measure_index(embeddings, chunk_count, questions, k=4):
+    """
+    Compare vector backends on the same synthetic chunks: recall@k against exact float search, query latency
+    and bytes per stored vector, for Chroma and the compact index (int8 and binary, full scan and IVF).
+    """
+    import numpy as np
+    from compact_index import CompactVectorIndex
+    from config import DATA_DIR
+
+    chunks = make_chunks(chunk_count)
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    truth = []
+    for question in questions:
+        query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        truth.append({chunks[i] for i in np.argsort(-(vectors @ query))[:k]})
+    ivf_lists = max(1, int(chunk_count ** 0.5))
+
+    def run(name, store, bytes_per_vector):
+        latencies, recalls = [], []
+        for question, expected in zip(questions, truth):
+            start = time.perf_counter()
+            docs = store.similarity_search(question, k=k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected & {d.page_content for d in docs}) / k)
+        result = {"backend": name, "chunks": chunk_count, f"recall@{k}": round(sum(recalls) / len(recalls), 3),
+                  "latency": _summary(latencies), "bytes_per_vector": bytes_per_vector}
+        print(f"index {name}: recall@{k} {result[f'recall@{k}']}, p50 {result['latency']['p50_ms']} ms", file=sys.stderr)
+        return result
+
+    report = []
+    try:
+        from langchain_community.vectorstores import Chroma
+        chroma = Chroma(collection_name="bench-index", embedding_function=embeddings,
+                        persist_directory=os.path.join(DATA_DIR, "index-chroma"))
+        for start in range(0, chunk_count, 4096):  # Chroma caps the batch size of one add
+            chroma.add_texts(chunks[start:start + 4096])
+        report.append(run("chroma", chroma, 4 * vectors.shape[1]))
+    except ImportError as e:
+        print(f"index chroma: skipped ({e})", file=sys.stderr)
+    for quantization in ("int8", "binary"):
+        for lists in (0, ivf_lists):
+            name = f"compact-{quantization}" + (f"-ivf{lists}" if lists else "")
+            store = CompactVectorIndex(os.path.join(DATA_DIR, f"index-{name}"), embeddings,
+                                       quantization=quantization, ivf_lists=lists)
+            store.add_texts(chunks)
+            report.append(run(name, store, store.code_size))
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the RAG workflow")
+    parser.add_argument("--pages", default="10,50", help="comma-separated corpus sizes for the ingest benchmark")
+    parser.add_argument("--query-pages", type=int, default=20, help="corpus size used for the query benchmark")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="seconds per fake web search")
+    parser.add_argument("--page-latency", type=float, default=0.02, help="seconds per fixture page fetch")
+    parser.add_argument("--real-embeddings", action="store_true", help="use the HuggingFace model instead of hashed fakes")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache enabled")
+    parser.add_argument("--llm-cache", action="store_true", help="leave the LLM response cache enabled")
+    parser.add_argument("--index-chunks", type=int, default=5000,
+                        help="synthetic chunks for the vector backend comparison (0 skips it)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    # Everything persisted goes to a throwaway directory; must be set before project modules import config
+    os.environ["RAG_DATA_DIR"] = tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "true" if args.answer_cache else "false")
+    os.environ.setdefault("LLM_CACHE_ENABLED", "true" if args.llm_cache else "false")
+
+    import utils
+    import search
+    import corpus_manager
+    from config import EMBEDDING_CACHE_DIR, EMBEDDING_BATCH_SIZE
+    from embedding_cache import CachedEmbeddings
+
+    FakeChatModel, FakeEmbeddings, FakeSearchTool = build_fakes(args.llm_latency, args.token_latency, args.search_latency)
+    # Pre-populate the singletons so initialize_llm_groq/initialize_llm_gemini hand out the fakes
+    utils._groq_llm = FakeChatModel()
+    utils._gemini_llm = FakeChatModel()
+    search._search_tool = FakeSearchTool()
+    if not args.real_embeddings:
+        model_name = "all-MiniLM-L6-v2"
+        utils._embeddings[model_name] = CachedEmbeddings(FakeEmbeddings(), model_name, EMBEDDING_CACHE_DIR,
+                                                         batch_size=EMBEDDING_BATCH_SIZE)
+
+    server, base_url = start_fixture_server(args.page_latency)
+    start_rss = _max_rss_mb()
+    try:
+        ingest_report = measure_ingest(base_url, [int(p) for p in args.pages.split(",") if p])
+        retriever = corpus_manager.get_retriever(urls=[f"{base_url}/page/{i}" for i in range(args.query_pages)])
+        query_report = measure_queries(retriever, make_questions(args.questions),
+                                       [int(c) for c in args.concurrency.split(",") if c])
+        index_report = (measure_index(utils.get_embeddings(), args.index_chunks, make_questions(args.questions))
+                        if args.index_chunks else [])
+    finally:
+        server.shutdown()
+
+    report = {
+        "config": vars(args),
+        "ingest": ingest_report,
+        "queries": query_report,
+        "index": index_report,
+        "memory": {"max_rss_mb_start": start_rss, "max_rss_mb_end": _max_rss_mb()},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return report
+
+def _max_rss_mb():
+    try:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:  # resource is POSIX-only
+        return None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import re
+import math
+import pickle
+import logging
+import threading
+from collections import Counter
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+def tokenize(text):
+    """Lowercase word tokens used for both indexing and querying."""
+    return re.findall(r"\w+", text.lower())
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunks, keyed by the same chunk IDs as the vectorstore.
+
+    Supports incremental add/delete so it can follow the ingestion manifest, and is persisted as a
+    pickle next to the Chroma index.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {chunk_id: term frequency}
+        self.lengths = {}  # chunk_id -> token count
+        self.documents = {}  # chunk_id -> (page_content, metadata)
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def add(self, ids, documents):
+        """Index documents under the given chunk IDs, replacing any previous entry with the same ID."""
+        with self._lock:
+            self.delete([i for i in ids if i in self.documents])
+            for chunk_id, doc in zip(ids, documents):
+                counts = Counter(tokenize(doc.page_content))
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = tf
+                length = sum(counts.values())
+                self.lengths[chunk_id] = length
+                self.total_length += length
+                self.documents[chunk_id] = (doc.page_content, dict(doc.metadata))
+
+    def delete(self, ids):
+        """Remove chunk IDs from the index; unknown IDs are ignored."""
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id not in self.documents:
+                    continue
+                text, _ = self.documents.pop(chunk_id)
+                for term in set(tokenize(text)):
+                    postings = self.postings.get(term)
+                    if postings is not None:
+                        postings.pop(chunk_id, None)
+                        if not postings:
+                            del self.postings[term]
+                self.total_length -= self.lengths.pop(chunk_id)
+
+    def search(self, query, k=4):
+        """Return up to k (chunk_id, score) pairs, best first."""
+        with self._lock:
+            n = len(self.documents)
+            if n == 0:
+                return []
+            avg_length = self.total_length / n
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get_document(self, chunk_id):
+        text, metadata = self.documents[chunk_id]
+        return Document(page_content=text, metadata=dict(metadata))
+
+    def save(self, path):
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(self, f)
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,46 @@
+import json
+import requests
+from langchain_core.documents import Document
+from config import RAG_API_URL
+
+def _result_documents(event):
+    # Turn serialized documents back into Documents so callers can keep using .page_content/.metadata
+    if event.get("type") == "done":
+        result = event["result"]
+        result["documents"] = [Document(**d) for d in result.get("documents") or []]
+    return event
+
+def stream_answer(question, urls=None, budget=None, api_url=RAG_API_URL, timeout=300):
+    """
+    Ask the RAG service a question over SSE and yield its events:
+    {"type": "node", "node"}, {"type": "token", "content"}, then {"type": "done", "result"}.
+    """
+    payload = {"question": question, "urls": urls, "budget": budget}
+    with requests.post(f"{api_url}/ask/stream", json=payload, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "error":
+                    raise RuntimeError(event["message"])
+                yield _result_documents(event)
+
+def ask(question, urls=None, budget=None, api_url=RAG_API_URL, timeout=300):
+    """Ask the RAG service a question and return the final result."""
+    payload = {"question": question, "urls": urls, "budget": budget}
+    response = requests.post(f"{api_url}/ask", json=payload, timeout=timeout)
+    response.raise_for_status()
+    return _result_documents({"type": "done", "result": response.json()})["result"]
+
+def update_urls(urls, refresh=False, api_url=RAG_API_URL, timeout=600):
+    """Have the service open (or re-sync, with `refresh`) the index for a URL set."""
+    response = requests.post(f"{api_url}/urls", json={"urls": urls, "refresh": refresh}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def readiness(api_url=RAG_API_URL, timeout=5):
+    """Return the service's startup report ({"ready", "warming_up", ...}), or None if it cannot be reached."""
+    try:
+        return requests.get(f"{api_url}/readyz", timeout=timeout).json()
+    except requests.RequestException:
+        return None
@@ -0,0 +1,338 @@
+import os
+import uuid
+import shutil
+import pickle
+import logging
+import threading
+from typing import Any, Iterable, List, Optional
+import numpy as np
+from langchain_core.vectorstores import VectorStore
+from langchain.schema import Document
+from config import COMPACT_QUANTIZATION, COMPACT_IVF_LISTS, COMPACT_IVF_PROBES, COMPACT_RERANK_K
+
+logger = logging.getLogger(__name__)
+
+CODES_FILE = "codes.{generation}.bin"  # a new generation is written by each compaction
+ROWS_FILE = "rows.pkl"
+SCAN_BLOCK_ROWS = 2048  # rows scored per step of the scan; small blocks keep the float temporaries in cache
+IVF_MIN_POINTS_PER_LIST = 39  # train IVF once there are this many vectors per partition
+COMPACT_DEAD_FRACTION = 0.25  # rewrite the codes file on save once this share of rows is deleted
+
+# Set bits per byte value, for Hamming distances on packed binary codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+def _kmeans(points, n_clusters, iterations=10, seed=0):
+    """Spherical k-means (cosine) with Lloyd iterations; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), n_clusters, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(points @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = points[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+class CompactVectorIndex(VectorStore):
+    """
+    Quantized in-process vector index, an alternative to Chroma for large corpora.
+
+    Vectors are stored as int8 (1 byte per dimension) or sign bits (1 bit per dimension) in one
+    contiguous memory-mapped file. A query scans the codes block by block (or only the nearest
+    IVF partitions once trained), keeps the `rerank_k` best candidates, and re-ranks them with
+    exact float cosine similarity using vectors from the embedding cache. Deletes are tombstones,
+    compacted away on `save` once they pile up. Implements the part of the vectorstore API the ingestion
+    code and retrievers use, so it plugs in wherever the Chroma store does.
+    """
+
+    def __init__(self, persist_directory, embedding_function, quantization=COMPACT_QUANTIZATION,
+                 ivf_lists=COMPACT_IVF_LISTS, ivf_probes=COMPACT_IVF_PROBES, rerank_k=COMPACT_RERANK_K):
+        if quantization not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization {quantization!r}, expected 'int8' or 'binary'")
+        self.directory = os.path.join(persist_directory, "compact")
+        self._embedding_function = embedding_function
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.rerank_k = rerank_k
+        self._lock = threading.RLock()
+        self._reset(quantization)
+        self._load()
+
+    def _reset(self, quantization):
+        self.quantization = quantization
+        self.generation = 0
+        self.dim = None
+        self.scale = None  # int8 quantization step, fixed on the first batch
+        self.center = None  # binary threshold per dimension (mean of the first batch), so bits split the data evenly
+        self.centroids = None
+        self.ids, self.texts, self.metadatas = [], [], []
+        self.alive = np.zeros(0, dtype=bool)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._rows = {}  # chunk id -> row
+        self._codes = None
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    @property
+    def code_size(self):
+        """Bytes per stored vector."""
+        if self.dim is None:
+            return 0
+        return self.dim if self.quantization == "int8" else (self.dim + 7) // 8
+
+    def __len__(self):
+        return len(self._rows)
+
+    # Persistence
+
+    def _codes_path(self, generation=None):
+        return os.path.join(self.directory, CODES_FILE.format(generation=self.generation if generation is None else generation))
+
+    def _open_codes(self):
+        rows = len(self.ids)
+        if rows == 0 or self.dim is None:
+            self._codes = None
+            return
+        dtype = np.int8 if self.quantization == "int8" else np.uint8
+        self._codes = np.memmap(self._codes_path(), dtype=dtype, mode="r", shape=(rows, self.code_size))
+
+    def _load(self):
+        path = os.path.join(self.directory, ROWS_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state["quantization"] != self.quantization:
+            logger.info(f"Compact index was built with {state['quantization']} codes, rebuilding as {self.quantization}")
+            self.delete_collection()
+            return
+        for key in ("generation", "dim", "scale", "center", "centroids", "ids", "texts", "metadatas", "alive",
+                    "assignments"):
+            setattr(self, key, state[key])
+        self._remove_stale_codes()
+        self._truncate_codes()
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids) if self.alive[row]}
+        self._open_codes()
+
+    def _remove_stale_codes(self):
+        """Delete codes files of other generations: left behind by a compaction that was cut short or superseded."""
+        current = os.path.basename(self._codes_path())
+        prefix, suffix = CODES_FILE.split("{generation}")
+        for name in os.listdir(self.directory):
+            if name != current and name.startswith(prefix) and name.endswith(suffix):
+                os.remove(os.path.join(self.directory, name))
+
+    def _truncate_codes(self):
+        """
+        Make the codes file and the row table agree after a crash: codes are appended by `add_texts` but
+        the row table only by `save`, so drop codes past the saved rows (they would shift later rows).
+        """
+        path = self._codes_path()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        expected = len(self.ids) * self.code_size
+        if size > expected:
+            logger.warning(f"Dropping {(size - expected) // max(1, self.code_size)} unsaved rows from {path}")
+            with open(path, "r+b") as f:
+                f.truncate(expected)
+        elif size < expected:
+            # Codes for the last saved rows never reached the disk: forget those rows
+            rows = size // self.code_size if self.code_size else 0
+            logger.warning(f"{path} holds {rows} of {len(self.ids)} rows, dropping the rest")
+            with open(path, "r+b" if size else "wb") as f:
+                f.truncate(rows * self.code_size)
+            self.ids, self.texts, self.metadatas = self.ids[:rows], self.texts[:rows], self.metadatas[:rows]
+            self.alive, self.assignments = self.alive[:rows], self.assignments[:rows]
+
+    def save(self):
+        """
+        Persist the row table (ids, texts, metadata, tombstones, IVF state); codes are written as they are added.
+
+        Compaction happens here too: the live codes go to a new generation's file, and replacing the row
+        table switches to it in one step, so a crash at any point leaves a table and codes that agree.
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            dead = len(self.ids) - len(self._rows)
+            previous = self._codes_path()
+            compacted = dead and dead >= COMPACT_DEAD_FRACTION * len(self.ids) and len(self.ids) >= 1000
+            if compacted:
+                self._compact()
+            state = {key: getattr(self, key) for key in ("quantization", "generation", "dim", "scale", "center",
+                                                         "centroids", "ids", "texts", "metadatas", "alive",
+                                                         "assignments")}
+            path = os.path.join(self.directory, ROWS_FILE)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(state, f)
+            os.replace(path + ".tmp", path)
+            if compacted:
+                os.remove(previous)
+
+    # Quantization
+
+    def _quantize(self, vectors):
+        if self.quantization == "binary":
+            if self.center is None:
+                self.center = vectors.mean(axis=0)
+            return np.packbits(vectors > self.center, axis=1)
+        if self.scale is None:
+            # Map the largest component of the first batch to 127; later outliers are clipped
+            self.scale = 127.0 / max(float(np.abs(vectors).max()), 1e-6)
+        return np.clip(np.rint(vectors * self.scale), -127, 127).astype(np.int8)
+
+    def _dequantize(self, codes):
+        if self.quantization == "binary":
+            signs = np.unpackbits(codes, axis=1)[:, :self.dim].astype(np.float32) * 2 - 1
+            return _normalize(self.center + signs * np.abs(self.center).mean())
+        return _normalize(codes.astype(np.float32))
+
+    def _approximate_scores(self, codes, query):
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > self.center)
+            return -_POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+        return codes.astype(np.float32) @ query
+
+    # VectorStore API
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(self._embedding_function.embed_documents(texts))
+        with self._lock:
+            self.delete([i for i in ids if i in self._rows])
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            codes = self._quantize(vectors)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._codes_path(), "ab") as f:
+                f.write(codes.tobytes())
+            start = len(self.ids)
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(dict(m or {}) for m in metadatas)
+            self.alive = np.concatenate([self.alive, np.ones(len(texts), dtype=bool)])
+            assignments = (np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+                           if self.centroids is not None else np.full(len(texts), -1, dtype=np.int32))
+            self.assignments = np.concatenate([self.assignments, assignments])
+            for offset, chunk_id in enumerate(ids):
+                self._rows[chunk_id] = start + offset
+            self._open_codes()
+            if self.ivf_lists and self.centroids is None and len(self._rows) >= self.ivf_lists * IVF_MIN_POINTS_PER_LIST:
+                self.train_ivf()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            for chunk_id in ids or []:
+                row = self._rows.pop(chunk_id, None)
+                if row is not None:
+                    self.alive[row] = False
+        return True
+
+    def delete_collection(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._reset(self.quantization)
+
+    def get(self, include=None, **kwargs):
+        """Return the live chunks as {"ids", "documents", "metadatas"}, like Chroma's `get`."""
+        with self._lock:
+            rows = sorted(self._rows.values())
+            return {"ids": [self.ids[r] for r in rows], "documents": [self.texts[r] for r in rows],
+                    "metadatas": [self.metadatas[r] for r in rows]}
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        query = _normalize(embedding)
+        with self._lock:
+            # Snapshot: appends only grow these and compaction swaps in new objects
+            codes, alive, assignments = self._codes, self.alive.copy(), self.assignments
+            texts, metadatas, centroids = self.texts, self.metadatas, self.centroids
+        if codes is None or not alive.any():
+            return []
+
+        if centroids is not None:
+            probes = np.argsort(-(centroids @ query))[:self.ivf_probes]
+            candidates = np.flatnonzero(alive & np.isin(assignments[:len(alive)], probes))
+        else:
+            candidates = None  # scan every row in contiguous blocks
+        shortlist_size = max(k, self.rerank_k)
+        best_rows, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        total = len(alive) if candidates is None else len(candidates)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            if candidates is None:
+                rows = np.arange(start, min(start + SCAN_BLOCK_ROWS, total))
+                block = np.asarray(codes[start:start + len(rows)])
+                keep = alive[rows]
+                if not keep.all():
+                    rows, block = rows[keep], block[keep]
+            else:
+                rows = candidates[start:start + SCAN_BLOCK_ROWS]
+                block = np.asarray(codes[rows])
+            scores = self._approximate_scores(block, query)
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > shortlist_size:
+                top = np.argpartition(-scores, shortlist_size - 1)[:shortlist_size]
+                rows, scores = rows[top], scores[top]
+            best_rows, best_scores = rows, scores
+        if len(best_rows) == 0:
+            return []
+
+        # Exact re-ranking of the shortlist with float vectors (served from the embedding cache)
+        exact = _normalize(self._embedding_function.embed_documents([texts[r] for r in best_rows])) @ query
+        order = np.argsort(-exact, kind="stable")[:k]
+        return [Document(page_content=texts[best_rows[i]], metadata=dict(metadatas[best_rows[i]])) for i in order]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=".", **kwargs):
+        index = cls(persist_directory, embedding, **kwargs)
+        index.add_texts(texts, metadatas, ids=ids)
+        index.save()
+        return index
+
+    # Maintenance
+
+    def train_ivf(self, n_lists=None, sample_size=None):
+        """(Re)partition the index: k-means on dequantized vectors, then assign every row to its nearest centroid."""
+        with self._lock:
+            n_lists = n_lists or self.ivf_lists
+            live_rows = np.flatnonzero(self.alive)
+            if self._codes is None or len(live_rows) < n_lists:
+                return
+            rng = np.random.default_rng(0)
+            sample_size = sample_size or min(len(live_rows), n_lists * 256)
+            sample = np.sort(rng.choice(live_rows, sample_size, replace=False))
+            self.centroids = _kmeans(self._dequantize(np.asarray(self._codes[sample])), n_lists)
+            for start in range(0, len(self.ids), SCAN_BLOCK_ROWS):
+                block = self._dequantize(np.asarray(self._codes[start:start + SCAN_BLOCK_ROWS]))
+                self.assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+            logger.info(f"Trained IVF with {n_lists} partitions on {sample_size} vectors")
+
+    def _compact(self):
+        """Write the live rows' codes to the next generation's file and drop deleted rows from the table in memory."""
+        live_rows = np.flatnonzero(self.alive)
+        with open(self._codes_path(self.generation + 1), "wb") as f:
+            for start in range(0, len(live_rows), SCAN_BLOCK_ROWS):
+                f.write(np.asarray(self._codes[live_rows[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+        self.generation += 1
+        self.ids = [self.ids[r] for r in live_rows]
+        self.texts = [self.texts[r] for r in live_rows]
+        self.metadatas = [self.metadatas[r] for r in live_rows]
+        self.assignments = self.assignments[live_rows]
+        self.alive = np.ones(len(live_rows), dtype=bool)
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._open_codes()
+        logger.info(f"Compacted index to {len(live_rows)} rows")
@@ -0,0 +1,122 @@
+"""Runtime settings for the RAG workflow. Every value can be overridden through the environment / .env file."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_URLS = [
+    "https://lilianweng.github.io/posts/2023-06-23-agent/",
+    "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
+    "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
+]
+
+# Root directory for everything persisted between runs (index, caches, manifests)
+DATA_DIR = os.getenv("RAG_DATA_DIR", ".rag_data")
+
+# Vectorstore
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", os.path.join(DATA_DIR, "chroma"))
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "adv-rag-chroma")  # prefix; each corpus gets its own collection
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma", or "compact" for the quantized in-process index
+COMPACT_QUANTIZATION = os.getenv("COMPACT_QUANTIZATION", "int8")  # "int8" or "binary"
+COMPACT_IVF_LISTS = int(os.getenv("COMPACT_IVF_LISTS", "0"))  # IVF partitions, 0 scans every vector
+COMPACT_IVF_PROBES = int(os.getenv("COMPACT_IVF_PROBES", "8"))  # partitions searched per query
+COMPACT_RERANK_K = int(os.getenv("COMPACT_RERANK_K", "100"))  # quantized candidates re-ranked with float vectors
+CORPUS_MEMORY_LIMIT_MB = int(os.getenv("CORPUS_MEMORY_LIMIT_MB", "1024"))  # estimated memory of open corpora
+CORPUS_MAX_OPEN = int(os.getenv("CORPUS_MAX_OPEN", "16"))
+
+# Web page fetching
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(DATA_DIR, "http_cache"))
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", "8"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "4"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "15"))
+
+# Streaming ingestion pipeline (fetch -> split -> embed -> write, bounded queues between stages)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))  # pages buffered between two stages
+INGEST_SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 splits in-thread
+INGEST_PROCESS_MIN_PAGES = int(os.getenv("INGEST_PROCESS_MIN_PAGES", "8"))  # smaller syncs skip the process pool
+
+# Embeddings
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(DATA_DIR, "embeddings"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps torch's default
+
+# Document grading
+GRADER_MAX_CONCURRENCY = int(os.getenv("GRADER_MAX_CONCURRENCY", "8"))
+GRADER_TIMEOUT = float(os.getenv("GRADER_TIMEOUT", "20"))  # seconds per grader call
+GRADER_MIN_RELEVANT = int(os.getenv("GRADER_MIN_RELEVANT", "0"))  # stop once this many are relevant, 0 grades all
+
+# Similarity pre-filter in front of the LLM document grader
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_ACCEPT = float(os.getenv("PREFILTER_ACCEPT", "0.8"))  # score >= accept: relevant without an LLM call
+PREFILTER_REJECT = float(os.getenv("PREFILTER_REJECT", "0.1"))  # score <= reject: irrelevant without an LLM call
+PREFILTER_CROSS_ENCODER = os.getenv("PREFILTER_CROSS_ENCODER", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty uses cosine similarity
+
+# Semantic answer cache in front of run_workflow
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # min cosine similarity for a hit
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+
+# Local router in front of the LLM question router
+ROUTER_LOCAL_ENABLED = os.getenv("ROUTER_LOCAL_ENABLED", "true").lower() == "true"
+ROUTER_VECTORSTORE_THRESHOLD = float(os.getenv("ROUTER_VECTORSTORE_THRESHOLD", "0.5"))  # score >= this: vectorstore
+ROUTER_WEBSEARCH_THRESHOLD = float(os.getenv("ROUTER_WEBSEARCH_THRESHOLD", "0.2"))  # score <= this: websearch
+ROUTER_TOP_K = int(os.getenv("ROUTER_TOP_K", "3"))  # nearest chunks averaged into the routing score
+ROUTER_CACHE_SIZE = int(os.getenv("ROUTER_CACHE_SIZE", "4096"))
+
+# Web search
+SEARCH_CACHE_DIR = os.getenv("SEARCH_CACHE_DIR", os.path.join(DATA_DIR, "search_cache"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "21600"))  # seconds
+WEB_WRITEBACK_ENABLED = os.getenv("WEB_WRITEBACK_ENABLED", "false").lower() == "true"  # upsert web results into the vectorstore
+
+# Context packing for the generate and hallucination prompts (tiktoken token budgets per model)
+CONTEXT_DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_TOKEN_BUDGETS = {
+    "llama-3.3-70b-versatile": CONTEXT_DEFAULT_TOKEN_BUDGET,
+    "gemini-2.0-flash": CONTEXT_DEFAULT_TOKEN_BUDGET,
+}
+CONTEXT_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_NEAR_DUPLICATE_THRESHOLD", "0.9"))
+
+# Retrieval: dense Chroma results fused with a BM25 index via reciprocal rank fusion
+RETRIEVAL_HYBRID = os.getenv("RETRIEVAL_HYBRID", "true").lower() == "true"
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))  # documents returned to the graph
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))  # candidates fetched from each side before fusion
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "false").lower() == "true"
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+
+# Per-request execution budget
+MAX_GENERATIONS = int(os.getenv("MAX_GENERATIONS", "3"))
+MAX_WEB_SEARCHES = int(os.getenv("MAX_WEB_SEARCHES", "2"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+
+# Telemetry
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serve Prometheus /metrics on this port, 0 disables
+
+# HTTP service (server.py) and the Streamlit client
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "8"))  # workflow runs executing at once
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "32"))  # runs waiting for a slot before new ones get 503
+RAG_API_URL = os.getenv("RAG_API_URL", "http://localhost:8000")
+
+# LLM gateway: per-model token buckets, retries with jittered backoff, failover to Gemini, hedged grader calls
+LLM_RATE_LIMITS = {
+    "llama-3.3-70b-versatile": {"rpm": int(os.getenv("GROQ_RPM", "30")), "tpm": int(os.getenv("GROQ_TPM", "12000"))},
+    "gemini-2.0-flash": {"rpm": int(os.getenv("GEMINI_RPM", "15")), "tpm": int(os.getenv("GEMINI_TPM", "1000000"))},
+}
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # seconds, doubled per attempt with full jitter
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "10"))  # wait for a provider's bucket before failing over
+LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "true").lower() == "true"
+LLM_HEDGE_GRADERS = os.getenv("LLM_HEDGE_GRADERS", "false").lower() == "true"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))  # seconds before a hedged grader call is sent
+
+# Exact-match LLM response cache in front of every gateway call (SQLite, shared across processes)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DATA_DIR, "llm_cache.sqlite"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+# Batch mode (batch.py)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # questions running through the graph at once
@@ -0,0 +1,75 @@
+import re
+import hashlib
+import logging
+import numpy as np
+import tiktoken
+from utils import get_embeddings
+from config import CONTEXT_TOKEN_BUDGETS, CONTEXT_DEFAULT_TOKEN_BUDGET, CONTEXT_NEAR_DUPLICATE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Singleton tokenizer used for budgeting
+_encoding = None
+
+def get_encoding():
+    """Return the tiktoken encoding used to count context tokens."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def token_budget(model_name):
+    """Return the context token budget configured for a model."""
+    return CONTEXT_TOKEN_BUDGETS.get(model_name, CONTEXT_DEFAULT_TOKEN_BUDGET)
+
+def _shingles(text, n=5):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+def deduplicate(documents, threshold=CONTEXT_NEAR_DUPLICATE_THRESHOLD):
+    """Drop exact duplicates and near-duplicates (word 5-gram Jaccard similarity >= threshold), keeping the first."""
+    kept, seen_hashes, kept_shingles = [], set(), []
+    for doc in documents:
+        normalized = " ".join(doc.page_content.split())
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        if not normalized or digest in seen_hashes:
+            continue
+        shingles = _shingles(normalized)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        seen_hashes.add(digest)
+        kept_shingles.append(shingles)
+        kept.append(doc)
+    return kept
+
+def rank_by_relevance(question, documents):
+    """Order documents by cosine similarity to the question, using the shared (cached) embeddings."""
+    if len(documents) < 2:
+        return list(documents)
+    embeddings = get_embeddings()
+    query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+    # Corpus chunks are already cached; web results are encoded but not written to the on-disk cache
+    vectors = np.asarray(embeddings.embed_transient([d.page_content for d in documents]), dtype=np.float32)
+    scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12)
+    return [documents[i] for i in np.argsort(-scores, kind="stable")]
+
+def pack_context(documents, question, budget=CONTEXT_DEFAULT_TOKEN_BUDGET):
+    """
+    Build the prompt context from documents: deduplicated, most relevant first, formatted as
+    "[n] (source) text" blocks and trimmed to `budget` tokens.
+    """
+    encoding = get_encoding()
+    blocks, used = [], 0
+    for doc in rank_by_relevance(question, deduplicate(documents)):
+        block = f"[{len(blocks) + 1}] ({doc.metadata.get('source', 'unknown')})\n{' '.join(doc.page_content.split())}"
+        tokens = encoding.encode(block)
+        remaining = budget - used
+        if len(tokens) > remaining:
+            # Keep a truncated tail block only if it still carries meaningful text
+            if remaining > 50:
+                blocks.append(encoding.decode(tokens[:remaining]))
+            break
+        blocks.append(block)
+        used += len(tokens) + 2
+    logger.info(f"Packed {len(blocks)} of {len(documents)} documents into the context ({used} tokens, budget {budget})")
+    return "\n\n".join(blocks)
@@ -0,0 +1,194 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from ingestion import corpus_fingerprint, corpus_directory, initialize_vectorstore, get_bm25_index, release_corpus
+from router import release_routing_index
+from utils import get_embeddings
+from telemetry import metrics
+from config import (COLLECTION_NAME, CORPUS_MEMORY_LIMIT_MB, CORPUS_MAX_OPEN, VECTOR_BACKEND, COMPACT_QUANTIZATION,
+                    ROUTER_LOCAL_ENABLED)
+
+logger = logging.getLogger(__name__)
+
+# Rough per-chunk overhead on top of text and vectors (Chroma metadata, HNSW links, BM25 postings)
+CHUNK_OVERHEAD_BYTES = 1024
+
+def _release_chroma(vectorstore):
+    """Best effort: stop Chroma's shared per-directory system so its in-memory segments are freed."""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        system = SharedSystemClient._identifer_to_system.pop(vectorstore._client._identifier, None)
+        if system is not None:
+            system.stop()
+    except (ImportError, AttributeError) as e:
+        logger.debug(f"Could not release Chroma system: {e}")
+
+class _Corpus:
+    def __init__(self, key, directory, retriever, size_bytes):
+        self.key = key
+        self.directory = directory
+        self.retriever = retriever
+        self.size_bytes = size_bytes
+        self.leases = 0
+
+class CollectionManager:
+    """
+    Open corpora (one Chroma collection + BM25 index per URL set and ingestion settings).
+
+    Each corpus lives in its own directory under VECTORSTORE_DIR, so different URL sets never
+    overwrite each other. Opened corpora stay in memory until their estimated size exceeds
+    `memory_limit_mb` or more than `max_open` are open; the least recently used ones are then
+    evicted (they are already persisted, so eviction only drops memory) and reopened lazily.
+    Corpora leased by a running request are never evicted.
+    """
+
+    def __init__(self, memory_limit_mb=CORPUS_MEMORY_LIMIT_MB, max_open=CORPUS_MAX_OPEN):
+        self.memory_limit_bytes = memory_limit_mb * 2 ** 20
+        self.max_open = max_open
+        self._open = OrderedDict()  # key -> _Corpus, least recently used first
+        self._lock = threading.Lock()
+        self._opening = {}  # key -> lock held while that corpus is being opened or synced
+
+    @staticmethod
+    def _estimate_bytes(directory, embedding_model):
+        bm25 = get_bm25_index(directory)
+        dim = getattr(get_embeddings(embedding_model), "dim", None) or 384
+        text_bytes = sum(len(text) for text, _ in bm25.documents.values())
+        # Text is held twice (vectorstore and BM25); vectors as float32, or int8 / sign bits in the compact index
+        if VECTOR_BACKEND == "compact":
+            vector_bytes = dim if COMPACT_QUANTIZATION == "int8" else (dim + 7) // 8
+        else:
+            vector_bytes = 4 * dim
+        if ROUTER_LOCAL_ENABLED:
+            # The local router keeps its own unit-normalized float32 copy of the corpus vectors
+            vector_bytes += 4 * dim
+        return 2 * text_bytes + len(bm25) * (vector_bytes + CHUNK_OVERHEAD_BYTES)
+
+    @staticmethod
+    def corpus_key(urls=None, **settings):
+        """Key of the corpus for these URLs and settings (also its directory name)."""
+        return corpus_fingerprint(urls, **settings)[:16]
+
+    def is_open(self, urls=None, **settings):
+        """Whether the corpus is already in memory, i.e. opening it would not touch disk or the network."""
+        with self._lock:
+            return self.corpus_key(urls, **settings) in self._open
+
+    def _touch(self, key):
+        with self._lock:
+            corpus = self._open.get(key)
+            if corpus is not None:
+                self._open.move_to_end(key)
+            return corpus
+
+    def open(self, urls=None, refresh=False, **settings):
+        """Return the open corpus for these URLs and settings, opening (and syncing) it if needed."""
+        key = self.corpus_key(urls, **settings)
+        corpus = self._touch(key)
+        if corpus is not None and not refresh:
+            metrics.incr("rag_corpus_opens_total", labels={"result": "hot"}, help_text="Corpus lookups by outcome")
+            return corpus
+        with self._lock:
+            opening = self._opening.setdefault(key, threading.Lock())
+        with opening:
+            corpus = self._touch(key)
+            if corpus is not None and not refresh:
+                return corpus
+            directory = corpus_directory(urls, **settings)
+            cold = os.path.exists(directory)
+            logger.info(f"Opening corpus {key} ({'reopening from disk' if cold else 'new'})")
+            retriever = initialize_vectorstore(urls=urls, refresh=refresh, persist_directory=directory,
+                                               collection_name=f"{COLLECTION_NAME}-{key}", **settings)
+            size = self._estimate_bytes(directory, settings.get("embedding_model", "all-MiniLM-L6-v2"))
+            with self._lock:
+                corpus = self._open.get(key)
+                if corpus is None:
+                    corpus = self._open[key] = _Corpus(key, directory, retriever, size)
+                else:
+                    # Refresh: swap in place, so leases taken on this corpus are released on the same object
+                    corpus.retriever, corpus.size_bytes = retriever, size
+                self._open.move_to_end(key)
+            metrics.incr("rag_corpus_opens_total", labels={"result": "cold" if cold else "new"},
+                         help_text="Corpus lookups by outcome")
+            self._evict_over_limit(keep=key)
+            return corpus
+
+    def get_retriever(self, urls=None, refresh=False, **settings):
+        """Return the retriever of a corpus (see `open`)."""
+        return self.open(urls, refresh, **settings).retriever
+
+    @contextmanager
+    def lease(self, urls=None, **settings):
+        """Yield a corpus retriever that cannot be evicted until the block exits."""
+        while True:
+            corpus = self.open(urls, **settings)
+            with self._lock:
+                # Re-check under the lock: it may have been evicted since `open` returned
+                if self._open.get(corpus.key) is corpus:
+                    corpus.leases += 1
+                    break
+        try:
+            yield corpus.retriever
+        finally:
+            with self._lock:
+                corpus.leases -= 1
+            self._evict_over_limit()
+
+    def _evict_over_limit(self, keep=None):
+        evicted = []
+        with self._lock:
+            for key in list(self._open):
+                total = sum(c.size_bytes for c in self._open.values())
+                if total <= self.memory_limit_bytes and len(self._open) <= self.max_open:
+                    break
+                corpus = self._open[key]
+                if key == keep or corpus.leases:
+                    continue
+                evicted.append(self._open.pop(key))
+        for corpus in evicted:
+            self._release(corpus)
+
+    def evict(self, urls=None, **settings):
+        """Drop a corpus from memory; it stays on disk and is reopened on next use."""
+        key = self.corpus_key(urls, **settings)
+        with self._lock:
+            corpus = self._open.get(key)
+            if corpus is None or corpus.leases:
+                return False
+            del self._open[key]
+        self._release(corpus)
+        return True
+
+    def _release(self, corpus):
+        logger.info(f"Evicting corpus {corpus.key} ({corpus.size_bytes / 2 ** 20:.1f} MB estimated) to disk")
+        metrics.incr("rag_corpus_evictions_total", help_text="Corpora evicted from memory")
+        release_corpus(corpus.directory)
+        release_routing_index(corpus.directory)
+        vectorstore = getattr(corpus.retriever, "vectorstore", None)
+        if vectorstore is not None:
+            _release_chroma(vectorstore)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "estimated_mb": round(sum(c.size_bytes for c in self._open.values()) / 2 ** 20, 1),
+                "memory_limit_mb": self.memory_limit_bytes / 2 ** 20,
+                "corpora": [{"key": c.key, "estimated_mb": round(c.size_bytes / 2 ** 20, 2), "leases": c.leases}
+                            for c in self._open.values()],
+            }
+
+# Singleton manager shared by the graph, the HTTP service and the UI
+_manager = None
+
+def get_collection_manager():
+    global _manager
+    if _manager is None:
+        _manager = CollectionManager()
+    return _manager
+
+def get_retriever(urls=None, refresh=False, **kwargs):
+    """Return a process-wide retriever for these URLs, opening (and syncing) the persisted index on first use."""
+    return get_collection_manager().get_retriever(urls, refresh, **kwargs)
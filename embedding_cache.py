@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+def text_hash(text):
+    """Return the cache key for a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no cross-process locking, one process per cache directory
+    fcntl = None
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` shared with other processes appending to the same cache."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by an on-disk cache keyed by (model name, text hash).
+
+    Vectors live in an append-only float32 file that is read through a numpy memmap, with an
+    append-only log mapping text hashes to rows. Appends take a file lock and place rows by the
+    size of the vectors file, so several processes can share a cache directory and a crash between
+    the two writes only leaves unreferenced rows. Only texts missing from the cache are sent to
+    the model, in batches of `batch_size`.
+    """
+
+    def __init__(self, model, model_name, cache_dir, batch_size=64, query_cache_size=1024):
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self.log_path = os.path.join(self.cache_dir, "index.log")
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+        self.lock_path = os.path.join(self.cache_dir, ".lock")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._log_offset = 0
+        self._dim = None
+        self._vectors = None
+        # Recent query vectors, so retrieval and the grading pre-filter embed a question only once
+        self._queries = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._refresh()
+
+    @property
+    def dim(self):
+        """Vector dimension, or None until the first vector has been cached."""
+        return self._dim
+
+    def _write_meta(self, dim):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model_name": self.model_name, "dim": dim}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _vector_rows(self):
+        if self._dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self._dim)
+
+    def _refresh(self):
+        """Read index rows appended since the last call (by this or another process) and remap the vectors."""
+        if self._dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self._dim = json.load(f)["dim"]
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+            complete = data.rfind(b"\n") + 1  # a line still being written is picked up next time
+            rows_on_disk = self._vector_rows()
+            for line in data[:complete].decode("utf-8").splitlines():
+                parts = line.split()
+                # Skip torn lines and rows past the end of the vectors file (truncated by a crash)
+                if len(parts) == 2 and parts[1].isdigit() and int(parts[1]) < rows_on_disk:
+                    self._index[parts[0]] = int(parts[1])
+            self._log_offset += complete
+        self._open_vectors()
+
+    def _open_vectors(self):
+        rows = self._vector_rows()
+        if rows == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+
+    def _append(self, keys, vectors):
+        """Append new vectors and their index rows under the cross-process file lock; the caller holds `_lock`."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with _file_lock(self.lock_path):
+            self._refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._write_meta(self._dim)
+            # Another process may have cached some of these meanwhile
+            new = [i for i, key in enumerate(keys) if key not in self._index]
+            if not new:
+                return
+            keys, vectors = [keys[i] for i in new], vectors[new]
+            row_bytes = 4 * self._dim
+            with open(self.vectors_path, "ab") as f:
+                size = f.tell()
+                start = size // row_bytes
+                if size != start * row_bytes:
+                    f.truncate(start * row_bytes)  # drop a partially written row
+                    f.seek(start * row_bytes)
+                f.write(vectors.tobytes())
+            with open(self.log_path, "a+b") as f:
+                # Cut a line torn by a crash: readers never consumed it, and it may hold a truncated row number
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - 256))
+                tail = f.read()
+                if tail and not tail.endswith(b"\n"):
+                    f.truncate(size - len(tail) + tail.rfind(b"\n") + 1)
+                f.write("".join(f"{key} {start + offset}\n" for offset, key in enumerate(keys)).encode("utf-8"))
+                self._log_offset = f.tell()
+            for offset, key in enumerate(keys):
+                self._index[key] = start + offset
+            self._open_vectors()
+
+    def embed_documents(self, texts):
+        keys = [text_hash(t) for t in texts]
+        with self._lock:
+            if any(k not in self._index for k in keys):
+                self._refresh()  # pick up vectors other processes have cached since
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._index and key not in missing:
+                    missing[key] = text
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # Encode without the lock, so cache hits from other threads are not held up by the forward pass
+            logger.info(f"Embedding {len(missing)} new chunks ({len(texts) - len(missing)} cached) with {self.model_name}")
+            missing_keys = list(missing)
+            for i in range(0, len(missing_keys), self.batch_size):
+                batch_keys = missing_keys[i:i + self.batch_size]
+                batch_vectors = self.model.embed_documents([missing[k] for k in batch_keys])
+                with self._lock:
+                    self._append(batch_keys, batch_vectors)
+
+        with self._lock:
+            rows = [self._index[k] for k in keys]
+            return self._vectors[rows].tolist() if rows else []
+
+    def cached_vectors(self, keys):
+        """Return a float32 matrix of the cached vectors for these text hashes, skipping unknown ones."""
+        with self._lock:
+            rows = [self._index[k] for k in keys if k in self._index]
+            if not rows:
+                return np.zeros((0, self._dim or 0), dtype=np.float32)
+            return np.asarray(self._vectors[rows])
+
+    def embed_transient(self, texts):
+        """
+        Embed texts that should not be kept, such as web search results: cached vectors are reused,
+        and the rest are encoded without being added to the cache.
+        """
+        keys = [text_hash(t) for t in texts]
+        with self._lock:
+            cached = {k: self._vectors[self._index[k]].tolist() for k in keys if k in self._index}
+        missing = list(dict.fromkeys(t for k, t in zip(keys, texts) if k not in cached))
+        encoded = {}
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            encoded.update(zip(batch, self.model.embed_documents(batch)))
+        return [cached[k] if k in cached else encoded[t] for k, t in zip(keys, texts)]
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+        vector = self.model.embed_query(text)
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > self._query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Embed many queries with batched forward passes and keep them in the query LRU, so the
+        embed_query calls made later for the same texts (routing, retrieval, grading) are hits.
+        """
+        with self._lock:
+            missing = [t for t in dict.fromkeys(texts) if t not in self._queries]
+        vectors = []
+        # Queries and documents are encoded the same way by the sentence-transformers models used here
+        for i in range(0, len(missing), self.batch_size):
+            vectors.extend(self.model.embed_documents(missing[i:i + self.batch_size]))
+        with self._lock:
+            for text, vector in zip(missing, vectors):
+                self._queries[text] = vector
+            while len(self._queries) > self._query_cache_size:
+                self._queries.popitem(last=False)
+        return [self.embed_query(t) for t in texts]
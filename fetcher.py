@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+from config import HTTP_CACHE_DIR, FETCH_MAX_WORKERS, FETCH_PER_HOST_LIMIT, FETCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (compatible; agentic-rag-fetcher/1.0)"
+
+# Singleton pooled HTTP session shared by every fetch
+_session = None
+_host_semaphores = {}
+_host_lock = threading.Lock()
+
+def get_session():
+    """Return a process-wide requests.Session with a connection pool sized for concurrent fetches."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        _session = session
+    return _session
+
+def _host_semaphore(url, limit):
+    """Return the semaphore limiting concurrent requests to the host of `url`."""
+    host = urlparse(url).netloc
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[host]
+
+def _cache_paths(url, cache_dir):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.html")
+
+def _read_cache(url, cache_dir):
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    with open(body_path, encoding="utf-8") as f:
+        return meta, f.read()
+
+def _write_cache(url, meta, body, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", encoding="utf-8", delete=False) as f:
+        f.write(body)
+    os.replace(f.name, body_path)
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False) as f:
+        json.dump(meta, f)
+    os.replace(f.name, meta_path)
+
+def fetch_url(url, timeout=FETCH_TIMEOUT, cache_dir=HTTP_CACHE_DIR, per_host_limit=FETCH_PER_HOST_LIMIT, session=None):
+    """
+    Fetch one URL with a conditional GET against the on-disk cache.
+
+    Returns (html, meta) where meta holds etag, last_modified and whether the cached body was
+    reused (`not_modified`). Raises on network or HTTP errors.
+    """
+    session = session or get_session()
+    cached_meta, cached_body = _read_cache(url, cache_dir)
+    headers = {}
+    if cached_meta:
+        if cached_meta.get("etag"):
+            headers["If-None-Match"] = cached_meta["etag"]
+        if cached_meta.get("last_modified"):
+            headers["If-Modified-Since"] = cached_meta["last_modified"]
+
+    with _host_semaphore(url, per_host_limit):
+        response = session.get(url, headers=headers, timeout=timeout)
+
+    if response.status_code == 304 and cached_body is not None:
+        logger.info(f"Not modified, using cached copy: {url}")
+        return cached_body, dict(cached_meta, not_modified=True)
+
+    response.raise_for_status()
+    if response.encoding is None or response.encoding.lower() == "iso-8859-1":
+        response.encoding = response.apparent_encoding
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    }
+    _write_cache(url, meta, response.text, cache_dir)
+    return response.text, dict(meta, not_modified=False)
+
+def html_to_document(url, html, meta=None):
+    """Turn a fetched HTML page into a Document with the same metadata WebBaseLoader produces."""
+    meta = meta or {}
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if soup.find("title"):
+        metadata["title"] = soup.find("title").get_text()
+    description = soup.find("meta", attrs={"name": "description"})
+    if description:
+        metadata["description"] = description.get("content", "No description found.")
+    html_tag = soup.find("html")
+    if html_tag:
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    for key in ("etag", "last_modified"):
+        if meta.get(key):
+            metadata[key] = meta[key]
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+def fetch_documents(urls, max_workers=FETCH_MAX_WORKERS, per_host_limit=FETCH_PER_HOST_LIMIT,
+                    timeout=FETCH_TIMEOUT, cache_dir=HTTP_CACHE_DIR, skip_failures=True, session=None):
+    """
+    Fetch and parse `urls` concurrently, returning Documents in input order.
+
+    With `skip_failures`, URLs that fail are logged and left out instead of failing the whole batch.
+    """
+    def _load(url):
+        html, meta = fetch_url(url, timeout=timeout, cache_dir=cache_dir, per_host_limit=per_host_limit, session=session)
+        return html_to_document(url, html, meta)
+
+    documents = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+        futures = [(url, executor.submit(_load, url)) for url in urls]
+        for url, future in futures:
+            try:
+                documents.append(future.result())
+            except Exception as e:
+                if not skip_failures:
+                    raise
+                logger.warning(f"Skipping {url}: {str(e)}")
+    return documents
+
+def iter_fetch_documents(urls, max_workers=FETCH_MAX_WORKERS, per_host_limit=FETCH_PER_HOST_LIMIT,
+                         timeout=FETCH_TIMEOUT, cache_dir=HTTP_CACHE_DIR, session=None):
+    """
+    Fetch and parse `urls` concurrently, yielding (url, Document) pairs in completion order.
+
+    At most 2 * `max_workers` pages are in flight or waiting to be consumed, so memory stays bounded
+    however long the URL list is. URLs that fail are logged and yielded with None.
+    """
+    def _load(url):
+        html, meta = fetch_url(url, timeout=timeout, cache_dir=cache_dir, per_host_limit=per_host_limit, session=session)
+        return html_to_document(url, html, meta)
+
+    urls = iter(urls)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {executor.submit(_load, url): url for url in islice(urls, 2 * max(1, max_workers))}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    document = future.result()
+                except Exception as e:
+                    logger.warning(f"Skipping {url}: {str(e)}")
+                    document = None
+                next_url = next(urls, None)
+                if next_url is not None:
+                    pending[executor.submit(_load, next_url)] = next_url
+                yield url, document
@@ -1,9 +1,16 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from utils import initialize_llm_groq
+from llm_gateway import get_llm_gateway
+from telemetry import instrument_chain
+
+# Singleton chain, built on first use
+_rag_chain = None
 
 def get_rag_chain():
-    llm = initialize_llm_groq()
+    global _rag_chain
+    if _rag_chain is not None:
+        return _rag_chain
+    llm = get_llm_gateway()
     
     prompt = ChatPromptTemplate.from_template(
         """You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
@@ -12,4 +19,5 @@ def get_rag_chain():
         Answer:"""
     )
     
-    return prompt | llm | StrOutputParser()
+    _rag_chain = instrument_chain(prompt | llm.runnable() | StrOutputParser(), "rag_generator")
+    return _rag_chain
@@ -1,6 +1,22 @@
+import time
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from utils import initialize_llm_groq
+from utils import get_embeddings
+from llm_gateway import get_llm_gateway
+from telemetry import instrument_chain, run_in_context
+from config import (GRADER_MAX_CONCURRENCY, GRADER_TIMEOUT, GRADER_MIN_RELEVANT,
+                    PREFILTER_ACCEPT, PREFILTER_REJECT, PREFILTER_CROSS_ENCODER, LLM_HEDGE_GRADERS)
+
+logger = logging.getLogger(__name__)
+
+# Singleton chains and cross-encoder, built on first use
+_document_grader = None
+_hallucination_grader = None
+_answer_grader = None
+_cross_encoder = None
 
 class GradeDocuments(BaseModel):
     """Binary score for relevance check on retrieved documents."""
@@ -15,8 +31,11 @@ class GradeAnswer(BaseModel):
     binary_score: str = Field(description="Answer addresses the question, 'yes' or 'no'")
 
 def get_document_grader():
-    llm = initialize_llm_groq()
-    structured_llm_grader_docs = llm.with_structured_output(GradeDocuments)
+    global _document_grader
+    if _document_grader is not None:
+        return _document_grader
+    llm = get_llm_gateway()
+    structured_llm_grader_docs = llm.runnable(GradeDocuments, hedge=LLM_HEDGE_GRADERS)
     
     system = """You are a grader assessing relevance of a retrieved document to a user question.
     If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant.
@@ -27,11 +46,105 @@ def get_document_grader():
         ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
     ])
     
-    return grade_prompt | structured_llm_grader_docs
+    _document_grader = instrument_chain(grade_prompt | structured_llm_grader_docs, "document_grader")
+    return _document_grader
+
+def get_cross_encoder(model_name=PREFILTER_CROSS_ENCODER):
+    """Initialize and return a singleton sentence-transformers CrossEncoder."""
+    global _cross_encoder
+    if _cross_encoder is None:
+        from sentence_transformers import CrossEncoder
+        _cross_encoder = CrossEncoder(model_name)
+    return _cross_encoder
+
+def prefilter_scores(question, documents):
+    """Score documents against the question locally: cross-encoder probability if configured, else cosine similarity."""
+    if PREFILTER_CROSS_ENCODER:
+        import torch
+        scores = get_cross_encoder().predict(
+            [(question, d.page_content) for d in documents], activation_fct=torch.nn.Sigmoid()
+        )
+        return np.asarray(scores, dtype=np.float32).reshape(-1)
+    embeddings = get_embeddings()
+    # Chunk vectors come from the embedding cache and the query vector from retrieval, so no new forward passes
+    query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+    chunks = np.asarray(embeddings.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+    norms = np.linalg.norm(chunks, axis=1) * np.linalg.norm(query)
+    return chunks @ query / np.maximum(norms, 1e-12)
+
+def prefilter_documents(question, documents, accept=PREFILTER_ACCEPT, reject=PREFILTER_REJECT):
+    """
+    Grade obvious hits and misses without the LLM.
+
+    Returns one grade per document: 'yes' above `accept`, 'no' below `reject`, and None for the
+    ambiguous band that still needs the LLM grader.
+    """
+    if not documents:
+        return []
+    scores = prefilter_scores(question, documents)
+    return ["yes" if s >= accept else "no" if s <= reject else None for s in scores]
+
+def grade_documents_concurrently(retrieval_grader, question, documents, max_concurrency=GRADER_MAX_CONCURRENCY,
+                                 timeout=GRADER_TIMEOUT, min_relevant=GRADER_MIN_RELEVANT, stats=None):
+    """
+    Grade documents in parallel with at most `max_concurrency` grader calls in flight.
+
+    Returns one grade per document: 'yes', 'no', or None when the call timed out, failed or was
+    skipped because `min_relevant` relevant documents had already been found. If a `stats` dict is
+    given, its "llm_graded", "timed_out" and "skipped" entries are set to the number of grader calls
+    that completed, were abandoned after `timeout`, and were never waited for after the early exit.
+    """
+    grades = [None] * len(documents)
+    if not documents:
+        return grades
+
+    started = {}
+    def _grade(i, doc):
+        started[i] = time.monotonic()
+        return retrieval_grader.invoke({"question": question, "document": doc.page_content}).binary_score.lower()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(documents))))
+    try:
+        pending = {run_in_context(executor, _grade, i, d): i for i, d in enumerate(documents)}
+        relevant = completed = timed_out = skipped = 0
+        while pending:
+            now = time.monotonic()
+            expiries = [started[i] + timeout for i in pending.values() if i in started]
+            wait_for = max(0, min(expiries) - now) if expiries else timeout
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                completed += 1
+                try:
+                    grades[i] = future.result()
+                except Exception as e:
+                    logger.warning(f"Grading document {i} failed: {e}")
+                    continue
+                if grades[i] == "yes":
+                    relevant += 1
+            if min_relevant and relevant >= min_relevant:
+                skipped = len(pending)
+                logger.info(f"Found {relevant} relevant documents, skipping {skipped} grader calls")
+                break
+            # Abandon calls that have been running longer than the per-call timeout
+            now = time.monotonic()
+            for future, i in list(pending.items()):
+                if i in started and now - started[i] >= timeout:
+                    logger.warning(f"Grading document {i} timed out after {timeout}s")
+                    del pending[future]
+                    timed_out += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if stats is not None:
+        stats.update(llm_graded=completed, timed_out=timed_out, skipped=skipped)
+    return grades
 
 def get_hallucination_grader():
-    llm = initialize_llm_groq()
-    structured_llm_grader_hallucination = llm.with_structured_output(GradeHallucinations)
+    global _hallucination_grader
+    if _hallucination_grader is not None:
+        return _hallucination_grader
+    llm = get_llm_gateway()
+    structured_llm_grader_hallucination = llm.runnable(GradeHallucinations, hedge=LLM_HEDGE_GRADERS)
     
     system = """You are a grader assessing whether an LLM generation is supported by a set of retrieved facts.
     Restrict yourself to give a binary score, either 'yes' or 'no'. If the answer is supported or partially supported by the set of facts, consider it a yes.
@@ -42,11 +155,15 @@ def get_hallucination_grader():
         ("human", "Set of facts: \n\n {documents} \n\n LLM generation: {generation}"),
     ])
     
-    return hallucination_prompt | structured_llm_grader_hallucination
+    _hallucination_grader = instrument_chain(hallucination_prompt | structured_llm_grader_hallucination, "hallucination_grader")
+    return _hallucination_grader
 
 def get_answer_grader():
-    llm = initialize_llm_groq()
-    structured_llm_grader_answer = llm.with_structured_output(GradeAnswer)
+    global _answer_grader
+    if _answer_grader is not None:
+        return _answer_grader
+    llm = get_llm_gateway()
+    structured_llm_grader_answer = llm.runnable(GradeAnswer, hedge=LLM_HEDGE_GRADERS)
     
     system = """You are a grader assessing whether an answer addresses / resolves a question.
     Give a binary score 'yes' or 'no'. Yes' means that the answer resolves the question."""
@@ -56,4 +173,5 @@ def get_answer_grader():
         ("human", "User question: \n\n {question} \n\n LLM generation: {generation}"),
     ])
     
-    return answer_prompt | structured_llm_grader_answer
+    _answer_grader = instrument_chain(answer_prompt | structured_llm_grader_answer, "answer_grader")
+    return _answer_grader
@@ -1,17 +1,31 @@
 from typing_extensions import TypedDict
 from typing import List
 from langgraph.graph import END, StateGraph
+from langchain_core.runnables import RunnableConfig
 from langchain.schema import Document
-from router import get_question_router
-from retriever import initialize_vectorstore
+from router import get_route
 from generator import get_rag_chain
-from grader import get_document_grader, get_hallucination_grader, get_answer_grader
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_tavily import TavilySearch
-from utils import initialize_vectorstore, load_environment  # Import load_environment
+from grader import get_document_grader, get_hallucination_grader, get_answer_grader, grade_documents_concurrently, prefilter_documents
+from utils import get_embeddings, initialize_llm_groq
+from context import pack_context, token_budget
+from ingestion import corpus_directory, corpus_version, upsert_documents
+from corpus_manager import get_retriever
+from search import search_web
+from answer_cache import get_answer_cache
+from telemetry import traced_node, new_trace, finish_trace, run_in_context, metrics
+from config import (GRADER_MIN_RELEVANT, PREFILTER_ENABLED, ANSWER_CACHE_ENABLED, WEB_WRITEBACK_ENABLED,
+                    MAX_GENERATIONS, MAX_WEB_SEARCHES, REQUEST_DEADLINE_SECONDS)
 # from grader import get_document_grader, get_hallucination_grader, get_answer_grader
 
-import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Singleton compiled workflow, built on first use
+_app = None
 
 
 # class GraphState(TypedDict):
@@ -30,6 +44,14 @@ class GraphState(TypedDict):
     hallucination_grade: str
     answer_grade: str
     urls: List[str]  # Add URLs to state
+    grading_stats: dict  # Pre-filter / LLM grading counts for the last grade_documents run
+    context: str  # Packed prompt context shared by generate and the hallucination grader
+    budget: dict  # max_generations, max_web_searches and deadline (epoch seconds) for this request
+    generations: int  # Generations produced so far
+    web_searches: int  # Web searches performed so far
+    best_generation: str  # Best answer so far, returned if the budget runs out
+    best_grades: dict  # hallucination_grade and answer_grade of best_generation, returned with it
+    status: str  # "running", "ok" or "budget exhausted"
 
 # def retrieve(state):
 #     print("---RETRIEVE from Vector Store DB---")
@@ -39,116 +61,173 @@ class GraphState(TypedDict):
 #     return {"documents": documents, "question": question}
 
 
-def retrieve(state):
-    print("---RETRIEVE from Vector Store DB---")
+def retrieve(state, config: RunnableConfig):
+    logger.info("---RETRIEVE from Vector Store DB---")
     question = state["question"]
     urls = state.get("urls", None)  # Get URLs from state
-    retriever = initialize_vectorstore(urls=urls)
+    # Prefer the retriever injected by the caller; otherwise reuse the process-wide one for these URLs
+    retriever = config.get("configurable", {}).get("retriever") or get_retriever(urls=urls)
     documents = retriever.invoke(question)
+    metrics.incr("rag_retrieved_documents_total", len(documents), help_text="Documents returned by the retriever")
     return {"documents": documents, "question": question, "urls": urls}
 
 
-def generate(state):
-    print("---GENERATE Answer---")
+def generate(state, config: RunnableConfig):
+    logger.info("---GENERATE Answer---")
     question = state["question"]
     documents = state["documents"]
     rag_chain = get_rag_chain()
-    generation = rag_chain.invoke({"context": documents, "question": question})
-    return {"documents": documents, "question": question, "generation": generation}
+    context = pack_context(documents, question, budget=token_budget(getattr(initialize_llm_groq(), "model_name", None)))
+    # Passing the run config lets stream_workflow pick up the LLM tokens as they are produced; the attempt
+    # number keeps a "not supported" retry from being answered with the cached, rejected generation
+    attempt = state.get("generations", 0)
+    config = {**config, "configurable": {**config.get("configurable", {}), "generation_attempt": attempt}}
+    generation = rag_chain.invoke({"context": context, "question": question}, config=config)
+    return {"documents": documents, "question": question, "generation": generation, "context": context,
+            "generations": state.get("generations", 0) + 1}
 
 def grade_documents(state):
-    print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+    logger.info("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
     question = state["question"]
     documents = state["documents"]
     retrieval_grader = get_document_grader()
+    # Settle clear hits and misses locally; only the ambiguous band goes to the LLM grader
+    grades = prefilter_documents(question, documents) if PREFILTER_ENABLED else [None] * len(documents)
+    ambiguous = [i for i, g in enumerate(grades) if g is None]
+    accepted = grades.count("yes")
+    stats = {"prefilter_accepted": accepted, "prefilter_rejected": grades.count("no"),
+             "llm_graded": 0, "timed_out": 0, "skipped": 0}
+    if ambiguous and not (GRADER_MIN_RELEVANT and accepted >= GRADER_MIN_RELEVANT):
+        min_relevant = GRADER_MIN_RELEVANT - accepted if GRADER_MIN_RELEVANT else 0
+        llm_grades = grade_documents_concurrently(
+            retrieval_grader, question, [documents[i] for i in ambiguous], min_relevant=min_relevant, stats=stats
+        )
+        for i, grade in zip(ambiguous, llm_grades):
+            grades[i] = grade
+    elif ambiguous:
+        # The pre-filter alone found enough relevant documents
+        stats["skipped"] = len(ambiguous)
+    # Only grades the pre-filter settled count as saved; timeouts and early-exit skips are reported separately
+    stats["llm_calls_saved"] = stats["prefilter_accepted"] + stats["prefilter_rejected"]
+    metrics.incr("rag_grader_llm_calls_saved_total", stats["llm_calls_saved"], help_text="Document grades settled by the pre-filter")
+    metrics.incr("rag_grader_timeouts_total", stats["timed_out"], help_text="Document grader calls abandoned after the timeout")
+    metrics.incr("rag_grader_skipped_total", stats["skipped"], help_text="Document grader calls skipped after enough relevant documents were found")
+    logger.info(f"---GRADE: PRE-FILTER SAVED {stats['llm_calls_saved']} OF {len(documents)} LLM CALLS---")
+    early_exit = GRADER_MIN_RELEVANT and grades.count("yes") >= GRADER_MIN_RELEVANT
     filtered_docs = []
     web_search = "No"
-    for d in documents:
-        score = retrieval_grader.invoke({"question": question, "document": d.page_content})
-        grade = score.binary_score
-        if grade.lower() == "yes":
-            print("---GRADE: DOCUMENT RELEVANT---")
+    for d, grade in zip(documents, grades):
+        if grade == "yes":
+            logger.info("---GRADE: DOCUMENT RELEVANT---")
             filtered_docs.append(d)
+        elif grade is None and early_exit:
+            # Skipped because enough relevant documents were already found
+            continue
         else:
-            print("---GRADE: DOCUMENT NOT RELEVANT---")
+            logger.info("---GRADE: DOCUMENT NOT RELEVANT---")
             web_search = "Yes"
-    return {"documents": filtered_docs, "question": question, "web_search": web_search}
+    return {"documents": filtered_docs, "question": question, "web_search": web_search, "grading_stats": stats}
 
-def web_search(state):
-    print("---WEB SEARCH. Append to vector store db---")
+def web_search(state, config: RunnableConfig):
+    logger.info("---WEB SEARCH---")
     question = state["question"]
     documents = state.get("documents", [])
-    print(documents)
-    # web_search_tool = TavilySearchResults(max_results=3, tavily_api_key=os.getenv("TAVILY_API_KEY", "your-api-key"), include_answer=True, ) # here is the problem
-    web_search_tool=TavilySearch(tavily_api_key=os.getenv("TAVILY_API_KEY", "your-api-key"), include_answer=True)
-    docs = web_search_tool.invoke({"query": question})
-    print(docs)
-    results = docs.get("results", [])
-    # if not results:
-    #     print("No results found in web search.")
-    #     return {"documents": documents, "question": question}
-    final_content=""
+    results = search_web(question)
+    metrics.incr("rag_web_search_results_total", len(results), help_text="Results returned by web search")
+    web_docs = []
     for d in results:
         if "content" not in d:
-            print("No content found in web search result.")
+            logger.info("No content found in web search result.")
             continue
         # Create Document object from web search result
-        doc = Document(page_content=d["content"], metadata={"source": d.get("url", "unknown")})
-        documents.append(doc)
-    # web_results = "\n".join([d["content"] for d in docs])
+        web_docs.append(Document(page_content=d["content"], metadata={"source": d.get("url", "unknown")}))
+    # Skip results already in the documents list (retries through "not useful" search again)
+    seen = {(doc.metadata.get("source"), doc.page_content) for doc in documents}
+    documents = documents + [doc for doc in web_docs if (doc.metadata["source"], doc.page_content) not in seen]
+    if WEB_WRITEBACK_ENABLED and web_docs:
+        logger.info("---WEB SEARCH. Append to vector store db---")
+        retriever = config.get("configurable", {}).get("retriever") or get_retriever(urls=state.get("urls"))
+        vectorstore = getattr(retriever, "vectorstore", None)
+        if vectorstore is not None:
+            upsert_documents(vectorstore, web_docs, persist_directory=corpus_directory(state.get("urls")))
+    return {"documents": documents, "question": question, "web_searches": state.get("web_searches", 0) + 1}
+
+def _deadline_passed(state):
+    return time.time() >= state["budget"]["deadline"]
 
-    # web_results = docs.get("content", "no content found")
-    # print(web_results)
-    # web_results = Document(page_content=web_results)
-    # print(web_results)
-    # documents.append(web_results)
-    return {"documents": documents, "question": question}
+def can_generate(state):
+    return state.get("generations", 0) < state["budget"]["max_generations"] and not _deadline_passed(state)
+
+def can_web_search(state):
+    return state.get("web_searches", 0) < state["budget"]["max_web_searches"] and not _deadline_passed(state)
+
+def budget_exhausted(state):
+    logger.info("---BUDGET EXHAUSTED: RETURNING BEST ANSWER SO FAR---")
+    if not state.get("best_generation"):
+        return {"status": "budget exhausted"}
+    # The grades in the state belong to the last attempt, so the best answer brings its own
+    return {"generation": state["best_generation"], **state.get("best_grades", {}), "status": "budget exhausted"}
 
 def route_question(state):
-    print("---ROUTE QUESTION---")
+    logger.info("---ROUTE QUESTION---")
     question = state["question"]
-    question_router = get_question_router()
-    source = question_router.invoke({"question": question})
-    if source.datasource == 'websearch':
-        print("---ROUTE QUESTION TO WEB SEARCH---")
+    datasource = get_route(question, corpus_directory(state.get("urls")))
+    if datasource == 'websearch':
+        logger.info("---ROUTE QUESTION TO WEB SEARCH---")
         return "websearch"
-    elif source.datasource == 'vectorstore':
-        print("---ROUTE QUESTION TO RAG---")
+    elif datasource == 'vectorstore':
+        logger.info("---ROUTE QUESTION TO RAG---")
         return "vectorstore"
 
 def decide_to_generate(state):
-    print("---ASSESS GRADED DOCUMENTS---")
+    logger.info("---ASSESS GRADED DOCUMENTS---")
     web_search = state["web_search"]
-    if web_search == "Yes":
-        print("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT TO QUESTION, INCLUDE WEB SEARCH---")
+    if web_search == "Yes" and can_web_search(state):
+        logger.info("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT TO QUESTION, INCLUDE WEB SEARCH---")
         return "websearch"
     else:
-        print("---DECISION: GENERATE---")
+        logger.info("---DECISION: GENERATE---")
         return "generate"
 
 def grade_generation_v_documents_and_question(state):
-    print("---CHECK HALLUCINATIONS---")
+    logger.info("---CHECK HALLUCINATIONS AND GRADE GENERATION vs QUESTION---")
     question = state["question"]
-    documents = state["documents"]
+    context = state["context"]
     generation = state["generation"]
     hallucination_grader = get_hallucination_grader()
-    score = hallucination_grader.invoke({"documents": documents, "generation": generation})
-    grade = score.binary_score
-    if grade == "yes":
-        print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-        print("---GRADE GENERATION vs QUESTION---")
-        answer_grader = get_answer_grader()
-        score = answer_grader.invoke({"question": question, "generation": generation})
-        answer_grade = score.binary_score
-        if answer_grade == "yes":
-            print("---DECISION: GENERATION ADDRESSES QUESTION---")
+    answer_grader = get_answer_grader()
+    # Both checks start as soon as the generation is complete instead of one after the other
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hallucination_future = run_in_context(
+            executor, hallucination_grader.invoke, {"documents": context, "generation": generation}
+        )
+        answer_future = run_in_context(executor, answer_grader.invoke, {"question": question, "generation": generation})
+        hallucination_grade = hallucination_future.result().binary_score
+        answer_grade = answer_future.result().binary_score
+    update = {"hallucination_grade": hallucination_grade, "answer_grade": answer_grade}
+    if hallucination_grade == "yes":
+        logger.info("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+    # Prefer grounded answers when picking the fallback for an exhausted budget
+    if not state.get("best_generation") or hallucination_grade == "yes":
+        update["best_generation"] = generation
+        update["best_grades"] = {"hallucination_grade": hallucination_grade, "answer_grade": answer_grade}
+    if hallucination_grade == "yes" and answer_grade == "yes":
+        update["status"] = "ok"
+    # Grades are kept in the state so the caller does not have to re-grade the final answer
+    return update
+
+def decide_generation_outcome(state):
+    if state["hallucination_grade"] == "yes":
+        if state["answer_grade"] == "yes":
+            logger.info("---DECISION: GENERATION ADDRESSES QUESTION---")
             return "useful"
-        else:
-            print("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
+        elif can_web_search(state) and can_generate(state):
+            logger.info("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
             return "not useful"
-    else:
-        print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
+    elif can_generate(state):
+        logger.info("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
         return "not supported"
+    return "budget exhausted"
 
 # def run_workflow(inputs):
 #     workflow = StateGraph(GraphState)
@@ -203,16 +282,19 @@ def grade_generation_v_documents_and_question(state):
 
 
 
-def run_workflow(inputs):
-    # Ensure URLs are included in inputs
+def build_workflow():
+    """Define the LangGraph workflow: nodes, edges and routing."""
     workflow = StateGraph(GraphState)
-    workflow.add_node("websearch", web_search)
-    workflow.add_node("retrieve", retrieve)
-    workflow.add_node("grade_documents", grade_documents)
-    workflow.add_node("generate", generate)
+    workflow.add_node("websearch", traced_node("websearch", web_search, takes_config=True))
+    workflow.add_node("retrieve", traced_node("retrieve", retrieve, takes_config=True))
+    workflow.add_node("grade_documents", traced_node("grade_documents", grade_documents))
+    workflow.add_node("generate", traced_node("generate", generate, takes_config=True))
+    workflow.add_node("grade_generation", traced_node("grade_generation", grade_generation_v_documents_and_question))
+    workflow.add_node("budget_exhausted", traced_node("budget_exhausted", budget_exhausted))
     
     workflow.add_edge("websearch", "generate")
     workflow.add_edge("retrieve", "grade_documents")
+    workflow.add_edge("generate", "grade_generation")
     
     workflow.set_conditional_entry_point(
         route_question,
@@ -226,35 +308,157 @@ def run_workflow(inputs):
     )
     
     workflow.add_conditional_edges(
-        "generate",
-        grade_generation_v_documents_and_question,
-        {"not supported": "generate", "useful": END, "not useful": "websearch"}
+        "grade_generation",
+        decide_generation_outcome,
+        {"not supported": "generate", "useful": END, "not useful": "websearch", "budget exhausted": "budget_exhausted"}
     )
-    
-    app = workflow.compile()
+    workflow.add_edge("budget_exhausted", END)
+    return workflow
+
+def get_app():
+    """Return the singleton compiled workflow, compiling it on first use."""
+    global _app
+    if _app is None:
+        _app = build_workflow().compile()
+    return _app
+
+def _with_budget(inputs):
+    """
+    Return the graph inputs with a fresh execution budget.
+
+    `inputs["budget"]` may override max_generations, max_web_searches and timeout (seconds); the
+    deadline is always computed here, from the time the run starts.
+    """
+    overrides = inputs.get("budget") or {}
+    budget = {
+        "max_generations": overrides.get("max_generations", MAX_GENERATIONS),
+        "max_web_searches": overrides.get("max_web_searches", MAX_WEB_SEARCHES),
+        "deadline": time.time() + overrides.get("timeout", REQUEST_DEADLINE_SECONDS),
+    }
+    return dict(inputs, budget=budget, generations=0, web_searches=0, status="running")
+
+def _cache_lookup(inputs):
+    """Return (cached result or None, question vector, (corpus directory, version)) for the semantic answer cache."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None, None
+    question_vector = get_embeddings().embed_query(inputs["question"])
+    directory = corpus_directory(inputs.get("urls"))
+    version = (directory, corpus_version(directory))
+    result, similarity = get_answer_cache().lookup(question_vector, version[1], corpus=directory)
+    if result is not None:
+        logger.info(f"---ANSWER CACHE HIT (similarity {similarity:.3f})---")
+        result = dict(result, answer_cache={"hit": True, "similarity": similarity})
+    return result, question_vector, version
+
+def _cache_store(final_state, question_vector, version):
+    # Only answers that passed both graders are worth serving again; "ok" is set only when both said yes,
+    # and a budget-exhausted fallback (possibly ungrounded) overrides it
+    if question_vector is not None and final_state.get("status") == "ok":
+        directory, current = version
+        get_answer_cache().store(question_vector, current, final_state, corpus=directory)
+
+def _apply_updates(output, final_state):
+    """Merge one `updates` chunk from the app stream into the final state and return node events."""
+    events = []
+    for key, value in output.items():
+        logger.info(f"Finished running: {key}:")
+        final_state.update(value or {})
+        events.append({"type": "node", "node": key, "update": value})
+    return events
+
+def _token_event(chunk):
+    """Turn a `messages` chunk into a token event when it comes from the answer generation."""
+    message, metadata = chunk
+    if metadata.get("langgraph_node") == "generate" and isinstance(message.content, str) and message.content:
+        return {"type": "token", "content": message.content}
+    return None
+
+def run_workflow(inputs, retriever=None):
+    """Run the workflow for one question. `retriever` is the prebuilt index to query; built lazily if omitted."""
+    cached, question_vector, version = _cache_lookup(inputs)
+    if cached is not None:
+        return cached
+    app = get_app()
     
     # Stream the workflow and collect final state
     final_state = {}
-    for output in app.stream(inputs):
-        for key, value in output.items():
-            print(f"Finished running: {key}:")
-            final_state.update(value)
-    
-    # Add grading results to the final state
-    if final_state.get("generation"):
-        hallucination_grader = get_hallucination_grader()
-        answer_grader = get_answer_grader()
-        final_state["hallucination_grade"] = hallucination_grader.invoke({
-            "documents": final_state["documents"],
-            "generation": final_state["generation"]
-        }).binary_score
-        final_state["answer_grade"] = answer_grader.invoke({
-            "question": final_state["question"],
-            "generation": final_state["generation"]
-        }).binary_score
+    trace = new_trace()
+    config = {"configurable": {"retriever": retriever, "trace": trace}}
+    for output in app.stream(_with_budget(inputs), config=config):
+        _apply_updates(output, final_state)
     
+    finish_trace(trace, final_state)
+    _cache_store(final_state, question_vector, version)
     return final_state
 
+def stream_workflow(inputs, retriever=None):
+    """
+    Run the workflow and yield events as they happen.
 
+    Yields {"type": "node", "node", "update"} when a node finishes, {"type": "token", "content"} for
+    each generated answer token, and finally {"type": "done", "result"} with the final state.
+    """
+    cached, question_vector, version = _cache_lookup(inputs)
+    if cached is not None:
+        yield {"type": "token", "content": cached.get("generation", "")}
+        yield {"type": "done", "result": cached}
+        return
+    app = get_app()
+    
+    final_state = {}
+    trace = new_trace()
+    config = {"configurable": {"retriever": retriever, "trace": trace}}
+    for mode, chunk in app.stream(_with_budget(inputs), config=config, stream_mode=["updates", "messages"]):
+        if mode == "updates":
+            yield from _apply_updates(chunk, final_state)
+        else:
+            event = _token_event(chunk)
+            if event:
+                yield event
+    
+    finish_trace(trace, final_state)
+    _cache_store(final_state, question_vector, version)
+    yield {"type": "done", "result": final_state}
 
+async def astream_workflow(inputs, retriever=None):
+    """Async variant of stream_workflow, yielding the same events."""
+    cached, question_vector, version = await asyncio.to_thread(_cache_lookup, inputs)
+    if cached is not None:
+        yield {"type": "token", "content": cached.get("generation", "")}
+        yield {"type": "done", "result": cached}
+        return
+    app = get_app()
+    
+    final_state = {}
+    trace = new_trace()
+    config = {"configurable": {"retriever": retriever, "trace": trace}}
+    async for mode, chunk in app.astream(_with_budget(inputs), config=config, stream_mode=["updates", "messages"]):
+        if mode == "updates":
+            for event in _apply_updates(chunk, final_state):
+                yield event
+        else:
+            event = _token_event(chunk)
+            if event:
+                yield event
+    
+    finish_trace(trace, final_state)
+    _cache_store(final_state, question_vector, version)
+    yield {"type": "done", "result": final_state}
 
+async def arun_workflow(inputs, retriever=None):
+    """Async variant of run_workflow, so many questions can share one event loop and compiled app."""
+    cached, question_vector, version = await asyncio.to_thread(_cache_lookup, inputs)
+    if cached is not None:
+        return cached
+    app = get_app()
+    
+    # Synchronous nodes are run by LangGraph in worker threads, keeping the event loop free
+    final_state = {}
+    trace = new_trace()
+    config = {"configurable": {"retriever": retriever, "trace": trace}}
+    async for output in app.astream(_with_budget(inputs), config=config):
+        _apply_updates(output, final_state)
+    
+    finish_trace(trace, final_state)
+    _cache_store(final_state, question_vector, version)
+    return final_state
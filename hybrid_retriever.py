@@ -0,0 +1,62 @@
+import hashlib
+from typing import Any, List
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain.schema import Document
+from config import RETRIEVAL_K, RETRIEVAL_FETCH_K, RETRIEVAL_RRF_K, RETRIEVAL_MMR, RETRIEVAL_MMR_LAMBDA
+
+def _doc_key(doc):
+    return hashlib.sha256(f"{doc.metadata.get('source', '')}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+def reciprocal_rank_fusion(result_lists, rrf_k=RETRIEVAL_RRF_K):
+    """Fuse ranked document lists: each document scores sum(1 / (rrf_k + rank)) over the lists it appears in."""
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+def maximal_marginal_relevance(query_vector, doc_vectors, k, lambda_mult=RETRIEVAL_MMR_LAMBDA):
+    """Return indices of k items balancing similarity to the query against similarity to items already picked."""
+    doc_vectors = doc_vectors / np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+    query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+    relevance = doc_vectors @ query_vector
+    selected = []
+    candidates = list(range(len(doc_vectors)))
+    while candidates and len(selected) < k:
+        if selected:
+            redundancy = (doc_vectors[candidates] @ doc_vectors[selected].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+        best = int(np.argmax(lambda_mult * relevance[candidates] - (1 - lambda_mult) * redundancy))
+        selected.append(candidates.pop(best))
+    return selected
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense (Chroma) + sparse (BM25) retriever fused with reciprocal rank fusion.
+
+    Each side returns `fetch_k` candidates; the fused list is cut to `k`, optionally after an MMR
+    pass over the fused candidates to drop near-redundant chunks.
+    """
+
+    vectorstore: Any
+    bm25: Any
+    embeddings: Any = None
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    rrf_k: int = RETRIEVAL_RRF_K
+    use_mmr: bool = RETRIEVAL_MMR
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        sparse = [self.bm25.get_document(chunk_id) for chunk_id, _ in self.bm25.search(query, k=self.fetch_k)]
+        fused = reciprocal_rank_fusion([dense, sparse], rrf_k=self.rrf_k)
+        if self.use_mmr and self.embeddings is not None and len(fused) > self.k:
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            doc_vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in fused]), dtype=np.float32)
+            return [fused[i] for i in maximal_marginal_relevance(query_vector, doc_vectors, self.k)]
+        return fused[:self.k]
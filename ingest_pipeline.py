@@ -0,0 +1,146 @@
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from langchain.schema import Document
+from utils import split_documents
+from config import INGEST_QUEUE_SIZE, INGEST_SPLIT_WORKERS, EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output (or its failure) on the queue to the next stage
+_DONE = object()
+
+def threaded(iterable, maxsize=INGEST_QUEUE_SIZE, name="stage"):
+    """
+    Run a generator stage in its own thread and yield its items through a bounded queue.
+
+    The stage blocks once `maxsize` items are waiting, so a slow consumer holds back its producers
+    instead of letting them buffer the whole corpus. Errors are re-raised in the consumer; closing
+    the returned generator stops the stage (and, through it, the stages feeding it).
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    threading.Thread(target=produce, name=f"ingest-{name}", daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+# Singleton process pool for splitting, started on first large sync; False once it has broken
+_split_executor = None
+_split_lock = threading.Lock()
+
+def get_split_executor(max_workers=INGEST_SPLIT_WORKERS):
+    """
+    Return the process pool used for tiktoken splitting, or None if it is unavailable.
+
+    Workers are spawned rather than forked, so they are safe next to the stage threads; spawning
+    re-imports the main module, which must therefore guard its entry point with `__name__ == "__main__"`.
+    """
+    global _split_executor
+    with _split_lock:
+        if _split_executor is None:
+            _split_executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Started {max_workers} splitter processes")
+    return _split_executor or None
+
+def _disable_split_executor(error):
+    global _split_executor
+    with _split_lock:
+        if _split_executor:
+            logger.warning(f"Splitter processes unavailable ({error}), splitting in-thread from now on")
+            _split_executor.shutdown(wait=False, cancel_futures=True)
+            _split_executor = False
+
+def _split_texts(texts_and_metadata, chunk_size, chunk_overlap):
+    """Process-pool entry point: plain (text, metadata) pairs in and out keep pickling cheap."""
+    documents = [Document(page_content=text, metadata=metadata) for text, metadata in texts_and_metadata]
+    return [(c.page_content, c.metadata) for c in split_documents(documents, chunk_size, chunk_overlap)]
+
+def split_pages(pages, chunk_size=250, chunk_overlap=0, executor=None, max_pending=INGEST_QUEUE_SIZE):
+    """
+    Add `page["chunks"]` to each page dict (which carries `page["docs"]`), yielding pages as they are split.
+
+    With an executor, up to `max_pending` pages are split in parallel and come out in completion order;
+    without one, pages are split in this thread in input order.
+    """
+    if executor is None:
+        for page in pages:
+            page["chunks"] = split_documents(page["docs"], chunk_size, chunk_overlap)
+            yield page
+        return
+
+    pending, submitting = {}, None
+    try:
+        for submitting in pages:
+            payload = [(d.page_content, d.metadata) for d in submitting["docs"]]
+            pending[executor.submit(_split_texts, payload, chunk_size, chunk_overlap)] = submitting
+            submitting = None
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from _collect(done, pending)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _collect(done, pending)
+    except BrokenProcessPool as e:
+        # A worker died or could not start: finish this sync in-thread, starting with the pages it lost
+        _disable_split_executor(e)
+        lost = list(pending.values()) + ([submitting] if submitting is not None else [])
+        yield from split_pages(lost, chunk_size, chunk_overlap)
+        yield from split_pages(pages, chunk_size, chunk_overlap)
+
+def _collect(done, pending):
+    for future in done:
+        page = pending[future]
+        page["chunks"] = [Document(page_content=text, metadata=metadata) for text, metadata in future.result()]
+        del pending[future]
+        yield page
+
+def embed_pages(pages, embeddings, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Embed chunks in batches as pages arrive, yielding each page once its chunks are embedded.
+
+    Vectors land in the embedding cache, so the vectorstore write that follows encodes nothing.
+    """
+    batch, texts = [], []
+    for page in pages:
+        batch.append(page)
+        texts.extend(c.page_content for c in page["chunks"])
+        if len(texts) >= batch_size:
+            embeddings.embed_documents(texts)
+            yield from batch
+            batch, texts = [], []
+    if texts:
+        embeddings.embed_documents(texts)
+    yield from batch
@@ -0,0 +1,275 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from langchain.schema import Document
+from config import (DEFAULT_URLS, VECTORSTORE_DIR, COLLECTION_NAME, RETRIEVAL_HYBRID, RETRIEVAL_K, VECTOR_BACKEND,
+                    INGEST_SPLIT_WORKERS, INGEST_PROCESS_MIN_PAGES)
+from utils import iter_web_documents, split_documents, get_embeddings
+from ingest_pipeline import threaded, split_pages, embed_pages, get_split_executor
+from bm25 import BM25Index
+from hybrid_retriever import HybridRetriever
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+BM25_FILE = "bm25.pkl"
+
+# Manifest version of each index synced in this process, keyed by persist directory
+_corpus_versions = {}
+# BM25 indexes loaded in this process, keyed by persist directory
+_bm25_indexes = {}
+# Serializes manifest read-modify-write between ingestion and web result write-back
+_manifest_lock = threading.Lock()
+
+def corpus_fingerprint(urls=None, chunk_size=250, chunk_overlap=0, embedding_model="all-MiniLM-L6-v2"):
+    """Return a stable hash identifying a corpus (URL set plus ingestion settings)."""
+    key = json.dumps({
+        "urls": sorted(urls or DEFAULT_URLS),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": embedding_model,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def corpus_directory(urls=None, **settings):
+    """Return the persist directory of a corpus; each URL set and settings combination gets its own collection."""
+    return os.path.join(VECTORSTORE_DIR, corpus_fingerprint(urls, **settings)[:16])
+
+def content_hash(text):
+    """Return the sha256 hex digest of a page or chunk text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(persist_directory=VECTORSTORE_DIR):
+    """Load the ingestion manifest, or an empty one if the index has never been built."""
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"settings": None, "version": 0, "sources": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, persist_directory=VECTORSTORE_DIR):
+    """Atomically write the ingestion manifest next to the index."""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    with tempfile.NamedTemporaryFile("w", dir=persist_directory, suffix=".tmp", delete=False) as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f.name, path)
+
+def _chunk_ids(url, chunks):
+    """Deterministic chunk IDs so a page's chunks can be replaced or deleted later."""
+    prefix = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return [f"{prefix}-{i}-{content_hash(c.page_content)[:16]}" for i, c in enumerate(chunks)]
+
+def get_bm25_index(persist_directory=VECTORSTORE_DIR):
+    """Return the BM25 index kept alongside the vectorstore, loading it from disk on first use."""
+    if persist_directory not in _bm25_indexes:
+        path = os.path.join(persist_directory, BM25_FILE)
+        _bm25_indexes[persist_directory] = BM25Index.load(path) if os.path.exists(path) else BM25Index()
+    return _bm25_indexes[persist_directory]
+
+def _add_chunks(vectorstore, bm25, chunks, chunk_ids):
+    """Write chunks to the dense and sparse indexes under the same IDs."""
+    vectorstore.add_documents(chunks, ids=chunk_ids)
+    bm25.add(chunk_ids, chunks)
+
+def _delete_chunks(vectorstore, bm25, chunk_ids):
+    vectorstore.delete(ids=chunk_ids)
+    bm25.delete(chunk_ids)
+
+def _changed_pages(fetched, sources, stats):
+    """Pipeline stage: turn fetched (url, document) pairs into page dicts, dropping failures and unchanged pages."""
+    for url, document in fetched:
+        if document is None:
+            logger.warning(f"No content loaded for {url}, keeping previous chunks if any")
+            continue
+        page_hash = content_hash(document.page_content)
+        entry = sources.get(url)
+        if entry and entry["content_hash"] == page_hash:
+            stats["unchanged"] += 1
+            continue
+        yield {"url": url, "docs": [document], "content_hash": page_hash, "entry": entry}
+
+def sync_vectorstore(vectorstore, manifest, urls=None, chunk_size=250, chunk_overlap=0, refresh=False, bm25=None):
+    """
+    Bring the vectorstore in line with `urls`, re-embedding only what changed.
+
+    Pages stream through fetch, split (in a process pool for larger syncs) and batched embedding
+    stages, and are written as they come out, so memory is bounded by INGEST_QUEUE_SIZE rather than
+    by the corpus.
+
+    New URLs are fetched and added, removed URLs have their chunks deleted, and when `refresh`
+    is set existing URLs are re-fetched and only re-embedded if their content hash changed.
+    Updates `manifest` (and the BM25 index, if given) in place and returns counts of
+    added/updated/removed/unchanged sources.
+    """
+    urls = urls or DEFAULT_URLS
+    bm25 = bm25 if bm25 is not None else BM25Index()
+    sources = manifest["sources"]
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+    # Drop chunks for URLs that are no longer part of the corpus (web search write-backs are kept)
+    for url in [u for u, e in sources.items() if u not in urls and e.get("origin") != "websearch"]:
+        chunk_ids = sources.pop(url)["chunk_ids"]
+        if chunk_ids:
+            _delete_chunks(vectorstore, bm25, chunk_ids)
+        stats["removed"] += 1
+
+    to_fetch = [u for u in urls if u not in sources or refresh]
+    stats["unchanged"] += len(urls) - len(to_fetch)
+    if to_fetch:
+        # Fetch, split and embed overlap as pipeline stages joined by bounded queues; this thread writes
+        executor = get_split_executor() if INGEST_SPLIT_WORKERS and len(to_fetch) >= INGEST_PROCESS_MIN_PAGES else None
+        pages = threaded(iter_web_documents(to_fetch), name="fetch")
+        pages = threaded(split_pages(_changed_pages(pages, sources, stats), chunk_size, chunk_overlap, executor), name="split")
+        embeddings = getattr(vectorstore, "embeddings", None)
+        if embeddings is not None:
+            pages = threaded(embed_pages(pages, embeddings), name="embed")
+
+        for page in pages:
+            url, docs, chunks, entry = page["url"], page["docs"], page["chunks"], page["entry"]
+            chunk_ids = _chunk_ids(url, chunks)
+            if entry and entry["chunk_ids"]:
+                _delete_chunks(vectorstore, bm25, entry["chunk_ids"])
+            if chunks:
+                _add_chunks(vectorstore, bm25, chunks, chunk_ids)
+            sources[url] = {
+                "content_hash": page["content_hash"],
+                "etag": docs[0].metadata.get("etag"),
+                "last_modified": docs[0].metadata.get("last_modified"),
+                "chunk_ids": chunk_ids,
+                "chunk_hashes": [content_hash(c.page_content) for c in chunks],
+            }
+            stats["updated" if entry else "added"] += 1
+
+    if stats["added"] or stats["updated"] or stats["removed"]:
+        manifest["version"] = manifest.get("version", 0) + 1
+    logger.info(f"Vectorstore sync complete: {stats}")
+    return stats
+
+def open_vectorstore(embeddings, persist_directory=VECTORSTORE_DIR, collection_name=COLLECTION_NAME):
+    """Open the index of a corpus with the configured backend: Chroma, or the quantized compact index."""
+    if VECTOR_BACKEND == "compact":
+        from compact_index import CompactVectorIndex
+        return CompactVectorIndex(persist_directory, embeddings)
+    from langchain_community.vectorstores import Chroma  # imported on first use to keep startup fast
+    return Chroma(collection_name=collection_name, embedding_function=embeddings, persist_directory=persist_directory)
+
+def _save_vectorstore(vectorstore):
+    # Chroma persists on write; the compact index writes its row table alongside the manifest
+    if hasattr(vectorstore, "save"):
+        vectorstore.save()
+
+def initialize_vectorstore(urls=None, chunk_size=250, chunk_overlap=0, embedding_model="all-MiniLM-L6-v2",
+                           persist_directory=VECTORSTORE_DIR, refresh=False, collection_name=COLLECTION_NAME):
+    """Open the persisted vectorstore (VECTOR_BACKEND) and incrementally sync it to `urls`. Returns a retriever."""
+    try:
+        logger.info("Initializing vectorstore")
+        embeddings = get_embeddings(embedding_model)
+        vectorstore = open_vectorstore(embeddings, persist_directory, collection_name)
+
+        manifest = load_manifest(persist_directory)
+        settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "embedding_model": embedding_model}
+        if VECTOR_BACKEND != "chroma":
+            # Only recorded for other backends, so existing Chroma indexes are not rebuilt
+            settings["vector_backend"] = VECTOR_BACKEND
+        if manifest["settings"] != settings:
+            # Chunking, embedding or backend settings changed: every stored chunk is stale
+            if manifest["sources"]:
+                logger.info("Ingestion settings changed, rebuilding vectorstore")
+            vectorstore.delete_collection()
+            vectorstore = open_vectorstore(embeddings, persist_directory, collection_name)
+            manifest = {"settings": settings, "version": manifest.get("version", 0) + 1, "sources": {}}
+            _bm25_indexes[persist_directory] = BM25Index()
+
+        bm25 = get_bm25_index(persist_directory)
+        if len(bm25) == 0 and manifest["sources"]:
+            # Index built before BM25 was introduced (or the pickle was lost): rebuild it from the vectorstore
+            stored = vectorstore.get(include=["documents", "metadatas"])
+            bm25.add(stored["ids"], [Document(page_content=t, metadata=m or {})
+                                     for t, m in zip(stored["documents"], stored["metadatas"])])
+
+        with _manifest_lock:
+            sync_vectorstore(vectorstore, manifest, urls, chunk_size, chunk_overlap, refresh=refresh, bm25=bm25)
+            save_manifest(manifest, persist_directory)
+            bm25.save(os.path.join(persist_directory, BM25_FILE))
+            _save_vectorstore(vectorstore)
+            _corpus_versions[persist_directory] = manifest["version"]
+        logger.info("Vectorstore initialized successfully")
+        if RETRIEVAL_HYBRID:
+            return HybridRetriever(vectorstore=vectorstore, bm25=bm25, embeddings=embeddings)
+        return vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+    except Exception as e:
+        logger.error(f"Failed to initialize vectorstore: {str(e)}")
+        raise
+
+def upsert_documents(vectorstore, documents, origin="websearch", persist_directory=VECTORSTORE_DIR):
+    """
+    Chunk and upsert ad-hoc documents (e.g. web search results) into the index.
+
+    Documents are grouped by their `source` URL and recorded under `<origin>:<url>` in the manifest,
+    so they never replace the chunks of a corpus page with the same URL. A source whose content hash
+    is already recorded is skipped, otherwise its previous chunks are replaced. Returns the number of
+    sources written.
+    """
+    with _manifest_lock:
+        manifest = load_manifest(persist_directory)
+        if manifest["settings"] is None:
+            logger.warning("Vectorstore has not been built yet, skipping upsert")
+            return 0
+        settings = manifest["settings"]
+        sources = manifest["sources"]
+        bm25 = get_bm25_index(persist_directory)
+        pages = {}
+        for doc in documents:
+            pages.setdefault(doc.metadata.get("source", "unknown"), []).append(doc)
+
+        written = 0
+        for url, docs in pages.items():
+            key = f"{origin}:{url}"
+            page_hash = content_hash("".join(d.page_content for d in docs))
+            entry = sources.get(key)
+            if entry and entry["content_hash"] == page_hash:
+                continue
+            chunks = split_documents(docs, settings["chunk_size"], settings["chunk_overlap"])
+            chunk_ids = _chunk_ids(key, chunks)
+            if entry and entry["chunk_ids"]:
+                _delete_chunks(vectorstore, bm25, entry["chunk_ids"])
+            if chunks:
+                _add_chunks(vectorstore, bm25, chunks, chunk_ids)
+            sources[key] = {
+                "content_hash": page_hash,
+                "etag": None,
+                "last_modified": None,
+                "chunk_ids": chunk_ids,
+                "chunk_hashes": [content_hash(c.page_content) for c in chunks],
+                "origin": origin,
+            }
+            written += 1
+
+        if written:
+            manifest["version"] = manifest.get("version", 0) + 1
+            save_manifest(manifest, persist_directory)
+            bm25.save(os.path.join(persist_directory, BM25_FILE))
+            _save_vectorstore(vectorstore)
+            _corpus_versions[persist_directory] = manifest["version"]
+            logger.info(f"Upserted {written} {origin} sources into the vectorstore")
+        return written
+
+def corpus_version(persist_directory=VECTORSTORE_DIR):
+    """Return the manifest version of the index; it changes whenever ingestion adds, updates or removes content."""
+    if persist_directory not in _corpus_versions:
+        _corpus_versions[persist_directory] = load_manifest(persist_directory)["version"]
+    return _corpus_versions[persist_directory]
+
+def corpus_chunk_hashes(persist_directory=VECTORSTORE_DIR):
+    """Return the content hashes of every chunk in the index, as recorded in the manifest."""
+    manifest = load_manifest(persist_directory)
+    return [h for entry in manifest["sources"].values() for h in entry.get("chunk_hashes", [])]
+
+def release_corpus(persist_directory):
+    """Forget the in-memory state (BM25 index, cached version) of an index; it is reloaded from disk on next use."""
+    _bm25_indexes.pop(persist_directory, None)
+    _corpus_versions.pop(persist_directory, None)
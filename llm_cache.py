@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from telemetry import metrics
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Singleton cache shared by every chain (through the LLM gateway) in the process
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def _schema_description(schema):
+    if schema is None:
+        return None
+    json_schema = getattr(schema, "model_json_schema", None) or getattr(schema, "schema", None)
+    return json_schema() if callable(json_schema) else getattr(schema, "__name__", str(schema))
+
+def _encode(value):
+    if isinstance(value, BaseMessage):
+        return json.dumps({"message": message_to_dict(value)})
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    elif hasattr(value, "dict"):
+        value = value.dict()
+    return json.dumps({"data": value})
+
+def _decode(text, schema):
+    payload = json.loads(text)
+    if "message" in payload:
+        return messages_from_dict([payload["message"]])[0]
+    data = payload["data"]
+    return schema(**data) if isinstance(schema, type) and isinstance(data, dict) else data
+
+class LLMResponseCache:
+    """
+    Persistent exact-match cache of LLM responses, stored in SQLite.
+
+    Keys hash the rendered prompt messages, the model (and its temperature) and the structured-output
+    schema, so a hit is only served for a call that would have been identical. Entries are evicted
+    least-recently-used beyond `max_entries`. Several processes can share the file (WAL mode).
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, schema TEXT, value TEXT NOT NULL, "
+            "latency REAL NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._size = self._count()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt, model, schema=None, temperature=None, attempt=0):
+        """Hash of the rendered prompt, model, temperature, output schema and regeneration attempt."""
+        if hasattr(prompt, "to_messages"):
+            rendered = [(m.type, m.content) for m in prompt.to_messages()]
+        else:
+            rendered = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        fields = {"prompt": rendered, "model": model, "temperature": temperature, "schema": _schema_description(schema)}
+        if attempt:
+            # First attempts keep the keys they had before attempts were part of the key
+            fields["attempt"] = attempt
+        payload = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, schema=None):
+        """Return the cached response for `key` (refreshing its LRU position), or None."""
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT value, latency FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                # A cache that cannot be read (e.g. locked by another process for too long) is a miss
+                logger.warning(f"LLM cache lookup failed: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += row[1]
+        if row is None:
+            metrics.incr("rag_llm_cache_lookups_total", labels={"result": "miss"}, help_text="LLM response cache lookups")
+            return None
+        metrics.incr("rag_llm_cache_lookups_total", labels={"result": "hit"}, help_text="LLM response cache lookups")
+        metrics.incr("rag_llm_cache_saved_seconds_total", row[1], help_text="LLM latency avoided by cache hits")
+        try:
+            return _decode(row[0], schema)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LLM cache entry: {e}")
+            return None
+
+    def put(self, key, value, latency, model=None, schema=None):
+        """Store a response with the latency it took, evicting least recently used entries over the cap."""
+        now = time.time()
+        name = getattr(schema, "__name__", None)
+        with self._lock:
+            try:
+                self._store(key, model, name, _encode(value), latency, now)
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache write failed: {e}")
+
+    def _store(self, key, model, name, value, latency, now):
+        self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (key, model, name, value, latency, now, now))
+        self._size += 1
+        if self._size > self.max_entries:
+            # Recount first: other processes sharing the file may have evicted already
+            self._size = self._count()
+            excess = self._size - self.max_entries
+            if excess > 0:
+                # Evict a little extra so the next few inserts do not each pay for an eviction
+                excess += self.max_entries // 20
+                self._conn.execute("DELETE FROM responses WHERE key IN "
+                                   "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)", (excess,))
+                self._size = self._count()
+
+    def stats(self):
+        """Hits, misses, hit rate, entries and the LLM latency hits saved, in seconds."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._size = 0
+
+def get_llm_cache():
+    """Return the singleton LLM response cache."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+            logger.info(f"LLM response cache opened at {_llm_cache.path} ({_llm_cache._size} entries)")
+    return _llm_cache
@@ -0,0 +1,235 @@
+import time
+import random
+import logging
+import threading
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import get_callback_manager_for_config
+from utils import initialize_llm_groq, initialize_llm_gemini
+from llm_cache import get_llm_cache
+from telemetry import CACHE_HIT_TAG, metrics, run_in_context
+from config import (LLM_RATE_LIMITS, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_MAX_QUEUE_WAIT,
+                    LLM_FAILOVER_ENABLED, LLM_HEDGE_DELAY, LLM_CACHE_ENABLED)
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses and exception class names that are worth retrying (rate limits, timeouts, transient errors)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "ResourceExhausted", "ServiceUnavailable", "APITimeoutError",
+                    "APIConnectionError", "InternalServerError", "DeadlineExceeded", "Timeout", "ReadTimeout"}
+
+class RateLimited(Exception):
+    """Raised when a provider's token bucket cannot admit a call within the allowed wait."""
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1, max_wait=None):
+        """Wait for `cost` tokens; returns False without taking any if that would take longer than `max_wait`."""
+        cost = min(cost, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait_for = max(0.0, (cost - self.tokens) / self.rate)
+            if max_wait is not None and wait_for > max_wait:
+                return False
+            # Tokens may go negative: later callers then wait for the ones reserved here to refill
+            self.tokens -= cost
+        if wait_for:
+            time.sleep(wait_for)
+        return True
+
+    def refund(self, cost=1):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + cost)
+
+class _Provider:
+    """One chat model with its request and token buckets, and structured-output variants built on demand."""
+
+    def __init__(self, name, llm):
+        self.name = name
+        self.llm = llm
+        model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or name
+        self.model = model.split("/")[-1]  # Gemini reports "models/<name>"
+        self.temperature = getattr(llm, "temperature", None)
+        limits = LLM_RATE_LIMITS.get(self.model, {})
+        self.requests = TokenBucket(limits["rpm"] / 60, limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"] / 60, limits["tpm"]) if limits.get("tpm") else None
+        self._runnables = {}
+
+    def runnable(self, schema=None):
+        key = schema.__name__ if schema is not None else None
+        if key not in self._runnables:
+            self._runnables[key] = self.llm.with_structured_output(schema) if schema is not None else self.llm
+        return self._runnables[key]
+
+    def admit(self, estimated_tokens, max_wait):
+        if self.requests is not None and not self.requests.acquire(1, max_wait):
+            return False
+        if self.tokens is not None and not self.tokens.acquire(estimated_tokens, max_wait):
+            if self.requests is not None:
+                self.requests.refund(1)
+            return False
+        return True
+
+def _is_retryable(error):
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+def _backoff(attempt, error):
+    """Full-jitter exponential backoff, honouring a Retry-After header when the provider sends one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    return max(retry_after, random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)))
+
+def _replay(message, prompt, config, provider):
+    """
+    Report a cached chat message to the run's callbacks as one streamed token and a finished model run.
+
+    Streaming consumers (the graph's `messages` mode) see model output through these callbacks only,
+    so without this a cached answer would produce no token events. The run is tagged CACHE_HIT_TAG so
+    usage accounting does not count it as an LLM call.
+    """
+    messages = prompt.to_messages() if hasattr(prompt, "to_messages") else [HumanMessage(content=str(prompt))]
+    message = message.model_copy(update={"id": message.id or str(uuid4())})
+    manager = get_callback_manager_for_config(config or {})
+    manager.add_tags([CACHE_HIT_TAG], inherit=False)
+    run_manager = manager.on_chat_model_start({"name": provider.model}, [messages], name="llm_cache",
+                                              invocation_params={"model": provider.model, "cached": True})[0]
+    if isinstance(message.content, str) and message.content:
+        chunk = AIMessageChunk(content=message.content, id=message.id)
+        run_manager.on_llm_new_token(message.content, chunk=ChatGenerationChunk(message=chunk))
+    run_manager.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    return message
+
+def _estimate_tokens(prompt):
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    return len(text) // 4 + 1
+
+class LLMGateway:
+    """
+    Shared entry point for every chain's LLM calls.
+
+    Each call waits for its provider's request/token buckets (LLM_RATE_LIMITS), retries rate limits
+    and transient errors with jittered exponential backoff, and fails over to the next provider
+    (Groq, then Gemini) when the buckets stay empty for LLM_MAX_QUEUE_WAIT or retries run out.
+    Calls built with `hedge=True` send a second request to the other provider if the first has not
+    answered within LLM_HEDGE_DELAY, and return whichever answers first. With a `cache`, identical
+    calls (same rendered prompt, model, schema and `generation_attempt` from the run's configurable)
+    are answered from it without taking a token.
+    """
+
+    def __init__(self, providers, max_retries=LLM_MAX_RETRIES, max_queue_wait=LLM_MAX_QUEUE_WAIT,
+                 hedge_delay=LLM_HEDGE_DELAY, cache=None):
+        self.providers = providers
+        self.cache = cache
+        self.max_retries = max_retries
+        self.max_queue_wait = max_queue_wait
+        self.hedge_delay = hedge_delay
+        self._hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+    def _invoke(self, providers, schema, prompt, config):
+        estimated = _estimate_tokens(prompt)
+        # Regenerations of the same prompt get their own cache entries, so a retry is not handed the rejected answer
+        attempt = (config or {}).get("configurable", {}).get("generation_attempt", 0)
+        last_error = None
+        for i, provider in enumerate(providers):
+            is_last = i == len(providers) - 1
+            key = self.cache.make_key(prompt, provider.model, schema, provider.temperature, attempt) if self.cache else None
+            if key is not None:
+                cached = self.cache.get(key, schema)
+                if isinstance(cached, BaseMessage):
+                    return _replay(cached, prompt, config, provider)
+                if cached is not None:
+                    return cached
+            # The last provider has nowhere to fail over to, so it waits for its bucket as long as needed
+            if not provider.admit(estimated, None if is_last else self.max_queue_wait):
+                metrics.incr("rag_llm_failovers_total", labels={"provider": provider.name, "reason": "rate_limited"},
+                             help_text="Calls moved to the next provider")
+                last_error = RateLimited(f"{provider.name} bucket empty")
+                continue
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    result = provider.runnable(schema).invoke(prompt, config=config)
+                except Exception as e:
+                    last_error = e
+                    if not _is_retryable(e) or attempt == self.max_retries:
+                        break
+                    delay = _backoff(attempt, e)
+                    metrics.incr("rag_llm_retries_total", labels={"provider": provider.name},
+                                 help_text="LLM calls retried after a retryable error")
+                    logger.warning(f"{provider.name} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
+                if key is not None and result is not None:
+                    self.cache.put(key, result, time.perf_counter() - start, provider.model, schema)
+                return result
+            if not is_last:
+                metrics.incr("rag_llm_failovers_total", labels={"provider": provider.name, "reason": "error"},
+                             help_text="Calls moved to the next provider")
+                logger.warning(f"{provider.name} failed ({type(last_error).__name__}: {last_error}), failing over")
+        raise last_error
+
+    def _invoke_hedged(self, schema, prompt, config):
+        first = run_in_context(self._hedge_executor, self._invoke, self.providers, schema, prompt, config)
+        done, _ = wait([first], timeout=self.hedge_delay)
+        if done or len(self.providers) < 2:
+            return first.result()
+        metrics.incr("rag_llm_hedged_total", help_text="Hedged LLM requests sent")
+        second = run_in_context(self._hedge_executor, self._invoke, self.providers[::-1], schema, prompt, config)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                metrics.incr("rag_llm_hedge_wins_total", labels={"request": "primary" if future is first else "hedge"},
+                             help_text="Which of the hedged requests answered first")
+                return result
+        raise error
+
+    def runnable(self, schema=None, hedge=False):
+        """Return a Runnable for chains: plain chat output, or `schema` instances when given."""
+        def call(prompt, config):
+            if hedge:
+                return self._invoke_hedged(schema, prompt, config)
+            return self._invoke(self.providers, schema, prompt, config)
+        return RunnableLambda(call, name=f"llm_gateway{'_' + schema.__name__ if schema is not None else ''}")
+
+# Singleton gateway shared by the router, graders and generator
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway():
+    """Initialize and return the singleton gateway over Groq (primary) and Gemini (failover)."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            providers = [_Provider("groq", initialize_llm_groq())]
+            if LLM_FAILOVER_ENABLED:
+                try:
+                    providers.append(_Provider("gemini", initialize_llm_gemini()))
+                except Exception as e:
+                    logger.warning(f"Gemini failover unavailable: {e}")
+            _gateway = LLMGateway(providers, cache=get_llm_cache() if LLM_CACHE_ENABLED else None)
+            logger.info(f"LLM gateway initialized with providers: {[p.name for p in providers]}")
+    return _gateway
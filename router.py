@@ -1,7 +1,28 @@
+import re
+import logging
+import threading
 from typing import Literal
+from collections import OrderedDict
+import numpy as np
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from utils import initialize_llm_groq
+from utils import get_embeddings
+from llm_gateway import get_llm_gateway
+from ingestion import corpus_version, corpus_chunk_hashes
+from telemetry import instrument_chain, metrics
+from config import (ROUTER_LOCAL_ENABLED, ROUTER_VECTORSTORE_THRESHOLD, ROUTER_WEBSEARCH_THRESHOLD,
+                    ROUTER_TOP_K, ROUTER_CACHE_SIZE, VECTORSTORE_DIR, CORPUS_MAX_OPEN)
+
+logger = logging.getLogger(__name__)
+
+# Singleton chain, built on first use
+_question_router = None
+
+# Normalized chunk vectors per corpus directory as (version, vectors), rebuilt when the version changes
+_routing_index = OrderedDict()
+# Routing decisions per (normalized question, corpus directory, corpus version)
+_route_cache = OrderedDict()
+_route_lock = threading.Lock()
 
 class RouteQuery(BaseModel):
     """Route a user query to the most relevant data source."""
@@ -10,8 +31,11 @@ class RouteQuery(BaseModel):
     )
 
 def get_question_router():
-    llm = initialize_llm_groq()
-    structured_llm_router = llm.with_structured_output(RouteQuery)
+    global _question_router
+    if _question_router is not None:
+        return _question_router
+    llm = get_llm_gateway()
+    structured_llm_router = llm.runnable(RouteQuery)
     
     system = """You are an expert at routing a user question to a vectorstore or websearch.
     The vectorstore contains documents related to agents, prompt engineering, and adversarial attacks.
@@ -22,4 +46,75 @@ def get_question_router():
         ("human", "{question}")
     ])
     
-    return route_prompt | structured_llm_router
+    _question_router = instrument_chain(route_prompt | structured_llm_router, "question_router")
+    return _question_router
+
+def normalize_question(question):
+    """Lowercase, strip punctuation and collapse whitespace so trivial rewrites share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+def _corpus_vectors(persist_directory=VECTORSTORE_DIR):
+    """Return the unit-normalized chunk vectors of a corpus, loaded from the embedding cache."""
+    version = corpus_version(persist_directory)
+    with _route_lock:
+        cached = _routing_index.get(persist_directory)
+        if cached is None or cached[0] != version:
+            vectors = get_embeddings().cached_vectors(corpus_chunk_hashes(persist_directory))
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            cached = _routing_index[persist_directory] = (version, vectors / np.maximum(norms, 1e-12))
+        _routing_index.move_to_end(persist_directory)
+        # Keep vectors only for about as many corpora as the collection manager holds open
+        while len(_routing_index) > CORPUS_MAX_OPEN:
+            _routing_index.popitem(last=False)
+        return cached[1]
+
+def release_routing_index(persist_directory):
+    """Drop the routing vectors of a corpus; they are rebuilt from the embedding cache on next use."""
+    with _route_lock:
+        _routing_index.pop(persist_directory, None)
+
+def route_question_locally(question, persist_directory=VECTORSTORE_DIR):
+    """
+    Score the question against the indexed corpus without calling the LLM.
+
+    The score is the mean cosine similarity of the question to its ROUTER_TOP_K nearest chunks.
+    Returns (datasource, score), with datasource None when the score falls in the uncertain band.
+    """
+    vectors = _corpus_vectors(persist_directory)
+    if len(vectors) == 0:
+        return None, 0.0
+    query = np.asarray(get_embeddings().embed_query(question), dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    similarities = vectors @ query
+    k = min(ROUTER_TOP_K, len(similarities))
+    score = float(np.mean(np.partition(similarities, -k)[-k:]))
+    if score >= ROUTER_VECTORSTORE_THRESHOLD:
+        return "vectorstore", score
+    if score <= ROUTER_WEBSEARCH_THRESHOLD:
+        return "websearch", score
+    return None, score
+
+def get_route(question, persist_directory=VECTORSTORE_DIR):
+    """Pick 'vectorstore' or 'websearch': cached decision, then local scoring, then the LLM router."""
+    key = (normalize_question(question), persist_directory, corpus_version(persist_directory))
+    with _route_lock:
+        if key in _route_cache:
+            _route_cache.move_to_end(key)
+            metrics.incr("rag_route_decisions_total", labels={"tier": "cache"}, help_text="Routing decisions by tier")
+            return _route_cache[key]
+
+    datasource = None
+    if ROUTER_LOCAL_ENABLED:
+        datasource, score = route_question_locally(question, persist_directory)
+        logger.info(f"Local router score {score:.3f}: {datasource or 'uncertain, asking the LLM'}")
+    if datasource is None:
+        datasource = get_question_router().invoke({"question": question}).datasource
+        metrics.incr("rag_route_decisions_total", labels={"tier": "llm"}, help_text="Routing decisions by tier")
+    else:
+        metrics.incr("rag_route_decisions_total", labels={"tier": "local"}, help_text="Routing decisions by tier")
+
+    with _route_lock:
+        _route_cache[key] = datasource
+        if len(_route_cache) > ROUTER_CACHE_SIZE:
+            _route_cache.popitem(last=False)
+    return datasource
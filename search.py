@@ -0,0 +1,47 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from config import SEARCH_CACHE_DIR, SEARCH_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Singleton Tavily client, reused across searches
+_search_tool = None
+
+def get_search_tool():
+    """Initialize and return a singleton TavilySearch client."""
+    global _search_tool
+    if _search_tool is None:
+        from langchain_tavily import TavilySearch  # imported on first use to keep startup fast
+        _search_tool = TavilySearch(tavily_api_key=os.getenv("TAVILY_API_KEY", "your-api-key"), include_answer=True)
+        logger.info("TavilySearch client initialized")
+    return _search_tool
+
+def _cache_path(query, cache_dir):
+    key = hashlib.sha256(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json")
+
+def search_web(query, tool=None, cache_dir=SEARCH_CACHE_DIR, ttl=SEARCH_CACHE_TTL):
+    """
+    Return web search results for `query`, served from the on-disk cache when younger than `ttl` seconds.
+
+    `tool` is any object with Tavily's `invoke({"query": ...})` interface; defaults to the shared client.
+    """
+    path = _cache_path(query, cache_dir)
+    if os.path.exists(path):
+        with open(path) as f:
+            cached = json.load(f)
+        if time.time() - cached["fetched_at"] < ttl:
+            logger.info(f"Web search cache hit for: {query}")
+            return cached["results"]
+
+    tool = tool or get_search_tool()
+    results = tool.invoke({"query": query}).get("results", [])
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False) as f:
+        json.dump({"query": query, "fetched_at": time.time(), "results": results}, f)
+    os.replace(f.name, path)
+    return results
@@ -0,0 +1,247 @@
+import warmup  # first, so startup time is measured from process start
+
+__import__('pysqlite3')
+import sys
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+import json
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from graph import astream_workflow
+from ingestion import corpus_directory, corpus_version
+from corpus_manager import get_collection_manager
+from llm_cache import get_llm_cache
+from answer_cache import get_answer_cache
+from router import normalize_question
+from telemetry import metrics
+from config import (SERVER_HOST, SERVER_PORT, SERVER_MAX_CONCURRENCY, SERVER_MAX_QUEUE, LLM_CACHE_ENABLED,
+                    ANSWER_CACHE_ENABLED, MAX_GENERATIONS, MAX_WEB_SEARCHES, REQUEST_DEADLINE_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Final-state keys returned to clients
+RESULT_KEYS = ("question", "generation", "documents", "web_search", "hallucination_grade", "answer_grade",
+               "status", "grading_stats", "trace", "answer_cache")
+
+class Budget(BaseModel):
+    """Per-request budget; clients may only tighten the server's limits, and the deadline is set server-side."""
+    model_config = ConfigDict(extra="forbid")
+
+    max_generations: Optional[int] = Field(None, ge=1, le=MAX_GENERATIONS)
+    max_web_searches: Optional[int] = Field(None, ge=0, le=MAX_WEB_SEARCHES)
+    timeout: Optional[float] = Field(None, gt=0, le=REQUEST_DEADLINE_SECONDS)  # seconds from the start of the run
+
+class AskRequest(BaseModel):
+    question: str
+    urls: Optional[List[str]] = None
+    budget: Optional[Budget] = None
+
+class UrlsRequest(BaseModel):
+    urls: List[str]
+    refresh: bool = False
+
+class ServiceOverloaded(Exception):
+    """Raised when the run queue is full; mapped to HTTP 503."""
+
+def _serialize_document(doc):
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+def serialize_event(event):
+    """Make a workflow event JSON-safe: node events drop their (large) state update, results keep RESULT_KEYS."""
+    if event["type"] == "node":
+        return {"type": "node", "node": event["node"]}
+    if event["type"] == "done":
+        result = {k: event["result"][k] for k in RESULT_KEYS if k in event["result"]}
+        result["documents"] = [_serialize_document(d) for d in result.get("documents") or []]
+        return {"type": "done", "result": result}
+    return event
+
+class _Job:
+    """One workflow run; events are kept so subscribers that join late (coalesced requests) replay them."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event, final=False):
+        async with self._changed:
+            self.events.append(event)
+            self.done = self.done or final
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > seen or self.done)
+                batch, finished = self.events[seen:], self.done
+            seen += len(batch)
+            for event in batch:
+                yield event
+            if finished and seen == len(self.events):
+                return
+
+class WorkflowService:
+    """
+    Runs questions through one compiled graph with bounded concurrency.
+
+    At most `max_concurrency` runs execute at once and at most `max_queue` more wait for a slot;
+    beyond that new runs are rejected (backpressure). Identical questions on the same URL set
+    that arrive while a run is in flight subscribe to that run instead of starting another.
+    """
+
+    def __init__(self, max_concurrency=SERVER_MAX_CONCURRENCY, max_queue=SERVER_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}  # coalescing key -> _Job
+        self._pending = 0  # runs admitted and not yet finished (running + queued)
+        self._ingest_locks = {}  # corpus key -> lock held while that corpus is opened or synced
+
+    @staticmethod
+    def _key(request):
+        budget = request.budget.model_dump(exclude_none=True) if request.budget else None
+        payload = json.dumps([normalize_question(request.question), request.urls, budget], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def open_corpus(self, urls=None, refresh=False):
+        """Open (and with `refresh`, re-sync) the corpus for a URL set; ingestion runs off the event loop, one per corpus."""
+        manager = get_collection_manager()
+        if not refresh and manager.is_open(urls):
+            return
+        lock = self._ingest_locks.setdefault(manager.corpus_key(urls), asyncio.Lock())
+        async with lock:
+            await asyncio.to_thread(manager.open, urls, refresh)
+
+    def submit(self, request):
+        """Return the job answering this request, joining an identical in-flight run when there is one."""
+        key = self._key(request)
+        job = self._inflight.get(key)
+        if job is not None:
+            metrics.incr("rag_server_coalesced_total", help_text="Requests served by an identical in-flight run")
+            return job
+        if self._pending >= self.max_concurrency + self.max_queue:
+            metrics.incr("rag_server_rejected_total", help_text="Requests rejected because the queue was full")
+            raise ServiceOverloaded()
+        job = self._inflight[key] = _Job()
+        self._pending += 1
+        asyncio.create_task(self._run(key, job, request))
+        return job
+
+    async def _run(self, key, job, request):
+        # The run belongs to no single client, so a disconnect does not cancel it for coalesced subscribers
+        try:
+            # Requests arriving during warm-up wait for it instead of loading the model themselves
+            await warmup.await_ready()
+            # Cold opens sync before taking a slot, so they do not hold one while runs on open corpora wait
+            await self.open_corpus(request.urls)
+            inputs = {"question": request.question, "urls": request.urls}
+            if request.budget:
+                inputs["budget"] = request.budget.model_dump(exclude_none=True)
+            async with self._slots:
+                # Lease the corpus so it cannot be evicted from memory while this run uses it; taking the
+                # lease may reopen an evicted corpus, so it is entered and exited off the event loop
+                lease = get_collection_manager().lease(request.urls)
+                retriever = await asyncio.to_thread(lease.__enter__)
+                try:
+                    async for event in astream_workflow(inputs, retriever=retriever):
+                        await job.publish(serialize_event(event), final=event["type"] == "done")
+                finally:
+                    await asyncio.to_thread(lease.__exit__, None, None, None)
+        except Exception as e:
+            logger.error(f"Workflow failed for question {request.question!r}: {e}")
+            await job.publish({"type": "error", "message": str(e)}, final=True)
+        finally:
+            self._pending -= 1
+            self._inflight.pop(key, None)
+            if not job.done:
+                await job.publish({"type": "error", "message": "workflow ended without a result"}, final=True)
+
+    def stats(self):
+        return {"running": min(self._pending, self.max_concurrency),
+                "queued": max(0, self._pending - self.max_concurrency),
+                "inflight_questions": len(self._inflight)}
+
+service = None
+
+def get_service():
+    """Return the process-wide service (created lazily so it binds to the server's event loop)."""
+    global service
+    if service is None:
+        service = WorkflowService()
+    return service
+
+@asynccontextmanager
+async def lifespan(app):
+    # Accept requests right away; the embedding model, index and graph load in the background
+    warmup.start_warmup()
+    warmup.mark_interactive()
+    yield
+
+app = FastAPI(title="Agentic RAG workflow", lifespan=lifespan)
+
+def _overloaded():
+    return HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "1"})
+
+@app.post("/ask")
+async def ask(request: AskRequest):
+    """Answer a question and return the final result as JSON."""
+    try:
+        job = get_service().submit(request)
+    except ServiceOverloaded:
+        raise _overloaded()
+    async for event in job.subscribe():
+        if event["type"] == "done":
+            return event["result"]
+        if event["type"] == "error":
+            raise HTTPException(status_code=500, detail=event["message"])
+    raise HTTPException(status_code=500, detail="workflow ended without a result")
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    """Answer a question as Server-Sent Events: `node`, `token`, then `done` (or `error`)."""
+    try:
+        job = get_service().submit(request)
+    except ServiceOverloaded:
+        raise _overloaded()
+
+    async def events():
+        async for event in job.subscribe():
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/urls")
+async def update_urls(request: UrlsRequest):
+    """Open (and with `refresh`, re-sync) the index for a URL set so later questions can use it."""
+    await get_service().open_corpus(request.urls, request.refresh)
+    return {"urls": request.urls, "corpus_version": corpus_version(corpus_directory(request.urls))}
+
+@app.get("/healthz")
+async def healthz():
+    return JSONResponse({"status": "ok", **get_service().stats(), "corpora": get_collection_manager().stats(),
+                         "answer_cache": get_answer_cache().stats() if ANSWER_CACHE_ENABLED else None,
+                         "llm_cache": get_llm_cache().stats() if LLM_CACHE_ENABLED else None,
+                         "startup": warmup.startup_report()})
+
+@app.get("/readyz")
+async def readyz():
+    """200 once the warm-up has loaded the model, index and graph; 503 while warming up or if it failed."""
+    report = warmup.startup_report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
@@ -1,10 +1,5 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-
 import streamlit as st
-from graph import run_workflow
-from utils import initialize_vectorstore
+from client import stream_answer, update_urls, readiness
 import logging
 import validators
 
@@ -35,16 +30,23 @@ if "urls" not in st.session_state:
 if "source" not in st.session_state:
     st.session_state.source = []
 
-# Initialize vectorstore (run once at startup or when URLs change)
+# Ask the RAG service to open the index for these URLs (run once at startup or when URLs change)
 @st.cache_resource
 def setup_vectorstore(_urls):
     logger.info(f"Initializing vectorstore with URLs: {_urls}")
-    return initialize_vectorstore(urls=_urls)
+    return update_urls(_urls)
 
 # Title and description
 st.title("Agentic AI Retrieval-Augmented Generation (RAG) Workflow")
 st.markdown("Enter URLs and a question to get an answer powered by a vectorstore or web search. View retrieved documents and grading results below.")
 
+# The service loads its models in the background after starting; questions asked meanwhile wait for it
+service_status = readiness()
+if service_status is None:
+    st.warning("The RAG service is not reachable. Start it with `python server.py`.")
+elif service_status.get("warming_up"):
+    st.info("The RAG service is warming up (loading the embedding model and index); the first answer may take a little longer.")
+
 # Input form for URLs and question
 with st.form(key="input_form"):
     st.subheader("Document URLs")
@@ -78,9 +80,13 @@ if update_urls_button:
             # Update session state and clear vectorstore cache
             if new_urls != st.session_state.urls:
                 st.session_state.urls = new_urls
-                setup_vectorstore.clear()  # Clear cache to force reinitialization
+                setup_vectorstore.clear()  # Drop the cached index info so the new URL set is picked up
+                # Each URL set is its own corpus on the service: a new set gets a fresh index (chunks embedded
+                # before come from the embedding cache), and a set opened before is re-synced incrementally
+                with st.spinner("Updating vectorstore..."):
+                    update_urls(new_urls, refresh=True)
                 logger.info(f"Updated URLs: {new_urls}")
-                st.success("URLs updated successfully. Vectorstore will be reinitialized.")
+                st.success("URLs updated successfully. Pages already embedded for an earlier URL set were not re-encoded.")
     except Exception as e:
         logger.error(f"Error processing URLs: {str(e)}")
         st.error(f"Error processing URLs: {str(e)}")
@@ -97,27 +103,56 @@ if clear_button:
 
     st.rerun()
 
+# Node names shown while the workflow runs
+NODE_LABELS = {
+    "retrieve": "Retrieved documents from the vectorstore",
+    "grade_documents": "Graded document relevance",
+    "websearch": "Searched the web",
+    "generate": "Generated answer",
+    "grade_generation": "Checked grounding and answer relevance",
+}
+
 # Process the question and display results
 if submit_button and question:
-    with st.spinner("Processing your question..."):
-        try:
-            logger.info(f"Processing question: {question}")
-            # Ensure vectorstore is initialized with current URLs
-            retriever = setup_vectorstore(st.session_state.urls)
-            # Run the LangGraph workflow
-            result = run_workflow({"question": question})
-            print("---WORKFLOW RESULT---", result)
-            
-            # Store results in session state
-            st.session_state.result = result.get("generation", "No answer generated.")
-            st.session_state.documents = result.get("documents", [])
-            st.session_state.web_search = result.get("web_search", "No")
-            st.session_state.hallucination_grade = result.get("hallucination_grade", "Not evaluated")
-            st.session_state.answer_grade = result.get("answer_grade", "Not evaluated")
-            logger.info("Workflow completed successfully")
-        except Exception as e:
-            logger.error(f"Error processing question: {str(e)}")
-            st.error(f"An error occurred: {str(e)}. Please try again or check your API keys.")
+    try:
+        logger.info(f"Processing question: {question}")
+        # Ensure vectorstore is initialized with current URLs
+        setup_vectorstore(st.session_state.urls)
+        # Live answer while streaming; replaced by the full results section below once done
+        answer_placeholder = st.empty()
+        result = {}
+        with st.status("Processing your question...", expanded=False) as status:
+            # Stream the LangGraph workflow: tokens go to the answer box as they arrive
+            answer = ""
+            restart_answer = False
+            for event in stream_answer(question, urls=st.session_state.urls):
+                if event["type"] == "token":
+                    if restart_answer:
+                        answer, restart_answer = "", False
+                    answer += event["content"]
+                    answer_placeholder.markdown(answer)
+                elif event["type"] == "node":
+                    status.write(NODE_LABELS.get(event["node"], event["node"]))
+                    # A retry after grading regenerates the answer from scratch
+                    restart_answer = event["node"] == "grade_generation"
+                elif event["type"] == "done":
+                    result = event["result"]
+            status.update(label="Done", state="complete")
+        answer_placeholder.empty()
+        logger.debug(f"Workflow result: {result}")
+        if result.get("status") == "budget exhausted":
+            st.warning("The request ran out of its retry/time budget; showing the best answer found so far.")
+        
+        # Store results in session state
+        st.session_state.result = result.get("generation", "No answer generated.")
+        st.session_state.documents = result.get("documents", [])
+        st.session_state.web_search = result.get("web_search", "No")
+        st.session_state.hallucination_grade = result.get("hallucination_grade") or "Not evaluated"
+        st.session_state.answer_grade = result.get("answer_grade") or "Not evaluated"
+        logger.info("Workflow completed successfully")
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}")
+        st.error(f"An error occurred: {str(e)}. Please try again, check that the RAG service (`python server.py`) is running, or check your API keys.")
 
 # Display results
 if st.session_state.result:
@@ -131,7 +166,7 @@ if st.session_state.result:
                 st.write(doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content)
                 st.write(f"**Source**: {doc.metadata.get('source', 'Unknown')}")
                 st.session_state.source.append(doc.metadata.get('source', 'Unknown'))
-                print("Doc metadata:", doc)
+                logger.debug(f"Doc metadata: {doc.metadata}")
     else:
         st.write("No documents retrieved.")
 
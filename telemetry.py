@@ -0,0 +1,222 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger("telemetry")
+
+# Node record of the graph node currently executing in this context (set by traced_node)
+_current_node = contextvars.ContextVar("rag_current_node", default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Tag on the callback runs the LLM gateway replays from its response cache; they are not LLM calls
+CACHE_HIT_TAG = "llm_cache:hit"
+
+class MetricsRegistry:
+    """Minimal thread-safe counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> {"buckets": [...], "sum": float, "count": int}
+        self.help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def incr(self, name, value=1, labels=None, help_text=""):
+        with self._lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.help.setdefault(name, help_text)
+
+    def observe(self, name, value, labels=None, help_text=""):
+        with self._lock:
+            key = self._key(name, labels)
+            hist = self.histograms.setdefault(key, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+            self.help.setdefault(name, help_text)
+
+    def render_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} counter"]
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} histogram"]
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(DURATION_BUCKETS, hist["buckets"]):
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist['count']}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist['sum']}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """
+    Counts LLM calls and token usage per chain (from the `chain:` tag) and per graph node.
+
+    Responses replayed from the LLM cache (tagged CACHE_HIT_TAG) are skipped, like structured
+    cache hits, which fire no model callbacks at all.
+    """
+
+    def _chain(self, tags):
+        return next((t.split(":", 1)[1] for t in tags or [] if t.startswith("chain:")), "unknown")
+
+    def _on_start(self, tags):
+        if CACHE_HIT_TAG in (tags or []):
+            return
+        node = _current_node.get()
+        labels = {"chain": self._chain(tags), "node": node["node"] if node else "none"}
+        metrics.incr("rag_llm_calls_total", labels=labels, help_text="LLM calls by chain and graph node")
+        if node is not None:
+            with node["lock"]:
+                node["llm_calls"] += 1
+
+    def on_llm_start(self, serialized, prompts, *, tags=None, **kwargs):
+        self._on_start(tags)
+
+    def on_chat_model_start(self, serialized, messages, *, tags=None, **kwargs):
+        self._on_start(tags)
+
+    def on_llm_end(self, response, *, tags=None, **kwargs):
+        if CACHE_HIT_TAG in (tags or []):
+            return
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        chain = {"chain": self._chain(tags)}
+        metrics.incr("rag_llm_prompt_tokens_total", prompt_tokens, labels=chain, help_text="Prompt tokens by chain")
+        metrics.incr("rag_llm_completion_tokens_total", completion_tokens, labels=chain, help_text="Completion tokens by chain")
+        node = _current_node.get()
+        if node is not None:
+            with node["lock"]:
+                node["prompt_tokens"] += prompt_tokens
+                node["completion_tokens"] += completion_tokens
+
+# Singleton callback attached to every chain
+_llm_callback = LLMUsageCallback()
+
+def instrument_chain(chain, name):
+    """Attach the usage callback and a `chain:<name>` tag to a chain built in router/grader/generator."""
+    return chain.with_config(callbacks=[_llm_callback], tags=[f"chain:{name}"], run_name=name)
+
+def run_in_context(executor, fn, *args):
+    """Submit fn to an executor inside a copy of the current context, so LLM calls stay attributed to the node."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+def new_trace():
+    """Start a per-request trace that node timings are appended to."""
+    return {"request_id": uuid.uuid4().hex, "started_at": time.time(), "nodes": []}
+
+def traced_node(name, fn, takes_config=False):
+    """Wrap a graph node to record wall time, LLM calls and token usage into the request trace and metrics."""
+    def node(state, config: RunnableConfig):
+        record = {"node": name, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "lock": threading.Lock()}
+        token = _current_node.set(record)
+        start = time.perf_counter()
+        try:
+            return fn(state, config) if takes_config else fn(state)
+        finally:
+            duration = time.perf_counter() - start
+            _current_node.reset(token)
+            del record["lock"]
+            record["duration_ms"] = round(duration * 1000, 2)
+            metrics.observe("rag_node_duration_seconds", duration, labels={"node": name}, help_text="Graph node wall time")
+            trace = config.get("configurable", {}).get("trace")
+            if trace is not None:
+                trace["nodes"].append(record)
+            logger.info(json.dumps({"event": "node_complete", "request_id": trace and trace["request_id"], **record}))
+    node.__name__ = name
+    return node
+
+def finish_trace(trace, final_state):
+    """Close a request trace: record workflow metrics, emit a structured log line and attach it to the result."""
+    duration = time.time() - trace["started_at"]
+    summary = {
+        "request_id": trace["request_id"],
+        "duration_ms": round(duration * 1000, 2),
+        "status": final_state.get("status"),
+        "llm_calls": sum(n["llm_calls"] for n in trace["nodes"]),
+        "prompt_tokens": sum(n["prompt_tokens"] for n in trace["nodes"]),
+        "completion_tokens": sum(n["completion_tokens"] for n in trace["nodes"]),
+        "generation_retries": max(0, final_state.get("generations", 0) - 1),
+        "web_searches": final_state.get("web_searches", 0),
+        "nodes": trace["nodes"],
+    }
+    metrics.observe("rag_workflow_duration_seconds", duration, help_text="End-to-end workflow wall time")
+    metrics.incr("rag_workflow_runs_total", labels={"status": summary["status"] or "unknown"}, help_text="Workflow runs by final status")
+    metrics.incr("rag_generation_retries_total", summary["generation_retries"], help_text="Regenerations after a failed grade")
+    logger.info(json.dumps({"event": "workflow_complete", **summary}))
+    final_state["trace"] = summary
+    return final_state
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+# Singleton metrics HTTP server
+_metrics_server = None
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics in a background thread (idempotent)."""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return _metrics_server
+
+def dump_metrics(path):
+    """Write the current metrics in Prometheus text format to a file."""
+    with open(path, "w") as f:
+        f.write(metrics.render_prometheus())
@@ -0,0 +1,37 @@
+from answer_cache import SemanticAnswerCache
+
+def test_answer_cache_serves_similar_questions():
+    cache = SemanticAnswerCache(threshold=0.95, max_entries=8, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", {"generation": "answer"})
+    result, similarity = cache.lookup([0.99, 0.05, 0.0], "v1")
+    assert result == {"generation": "answer"} and similarity > 0.95
+    assert cache.lookup([0.0, 1.0, 0.0], "v1")[0] is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+def test_answer_cache_invalidates_on_corpus_version_and_ttl():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=8, ttl=60)
+    cache.store([1.0, 0.0], 1, {"generation": "old"}, corpus="a")
+    cache.store([1.0, 0.0], 3, {"generation": "other corpus"}, corpus="b")
+    assert cache.lookup([1.0, 0.0], 2, corpus="a")[0] is None
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0], 3, corpus="b")[0] == {"generation": "other corpus"}
+    expiring = SemanticAnswerCache(threshold=0.9, max_entries=8, ttl=-1)
+    expiring.store([1.0, 0.0], "v1", {"generation": "stale"})
+    assert expiring.lookup([1.0, 0.0], "v1")[0] is None
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", {"generation": "x"})
+    cache.store([0.0, 1.0, 0.0], "v1", {"generation": "y"})
+    assert cache.lookup([1.0, 0.0, 0.0], "v1")[0] == {"generation": "x"}
+    cache.store([0.0, 0.0, 1.0], "v1", {"generation": "z"})
+    assert cache.lookup([0.0, 1.0, 0.0], "v1")[0] is None
+    assert cache.lookup([1.0, 0.0, 0.0], "v1")[0] == {"generation": "x"}
+
+def test_answer_cache_keeps_corpora_apart():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=8, ttl=60)
+    cache.store([1.0, 0.0], 1, {"generation": "from a"}, corpus="a")
+    assert cache.lookup([1.0, 0.0], 3, corpus="b")[0] is None
+    assert cache.lookup([1.0, 0.0], 1, corpus="a")[0] == {"generation": "from a"}
+    assert cache.stats()["entries"] == 1
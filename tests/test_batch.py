@@ -0,0 +1,62 @@
+import io
+import json
+import asyncio
+from contextlib import contextmanager
+from types import SimpleNamespace
+import pytest
+import batch
+
+class _Corpora:
+    @contextmanager
+    def lease(self, urls=None):
+        yield None
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Answer questions after a per-question delay; returns the questions run and the query batches embedded."""
+    log = {"runs": [], "embedded": []}
+    delays = {"slow question": 0.2, "fast question": 0.0}
+
+    async def fake_workflow(inputs, retriever=None):
+        log["runs"].append(inputs["question"])
+        await asyncio.sleep(delays.get(inputs["question"], 0.05))
+        if inputs["question"] == "broken question":
+            raise RuntimeError("grader unavailable")
+        return {"generation": f"answer to {inputs['question']}", "status": "ok", "documents": []}
+
+    monkeypatch.setattr(batch, "arun_workflow", fake_workflow)
+    monkeypatch.setattr(batch, "get_collection_manager", lambda: _Corpora())
+    monkeypatch.setattr(batch, "get_embeddings", lambda: SimpleNamespace(embed_queries=log["embedded"].append))
+    return log
+
+def _run(records, **kwargs):
+    output = io.StringIO()
+    summary = asyncio.run(batch.run_batch(records, output, **kwargs))
+    return summary, [json.loads(line) for line in output.getvalue().splitlines()]
+
+def test_group_questions_merges_normalized_duplicates_per_url_set():
+    records = [{"id": 1, "question": "What is memory?"}, {"id": 2, "question": "what is memory"},
+               {"id": 3, "question": "What is memory?", "urls": ["http://other"]}]
+    groups = batch.group_questions(records, urls=["http://default"])
+    assert [[r["id"] for r in g] for g in groups] == [[1, 2], [3]]
+    assert groups[0][1]["urls"] == ["http://default"]
+
+def test_run_batch_runs_duplicates_once_and_writes_lines_as_runs_finish(runs):
+    records = [{"id": 1, "question": "slow question"}, {"id": 2, "question": "fast question"},
+               {"id": 3, "question": "Slow question?"}]
+    summary, lines = _run(records, concurrency=4, embed_window=2)
+    assert runs["runs"] == ["slow question", "fast question"]
+    assert runs["embedded"] == [["slow question", "fast question"]]
+    # The fast question finishes first; the duplicate gets its own line pointing at the run it shared
+    assert [line["id"] for line in lines] == [2, 1, 3]
+    assert lines[2]["duplicate_of"] == 1 and lines[2]["generation"] == "answer to slow question"
+    assert (summary["questions"], summary["unique"], summary["errors"]) == (3, 2, 0)
+
+def test_run_batch_reports_errors_on_every_line_of_a_failed_question(runs):
+    records = [{"id": "a", "question": "broken question"}, {"id": "b", "question": "Broken question"},
+               {"id": "c", "question": "fast question"}]
+    summary, lines = _run(records, concurrency=1)
+    by_id = {line["id"]: line for line in lines}
+    assert by_id["a"]["error"] == by_id["b"]["error"] == "grader unavailable"
+    assert by_id["c"]["status"] == "ok"
+    assert summary["errors"] == 2
@@ -0,0 +1,42 @@
+import time
+from types import SimpleNamespace
+from langchain_core.runnables import RunnableLambda
+import graph
+
+def _grader(*scores):
+    scores = list(scores)
+    return lambda: RunnableLambda(lambda inputs: SimpleNamespace(binary_score=scores.pop(0)))
+
+def _grade(state, monkeypatch, hallucination, answer):
+    monkeypatch.setattr(graph, "get_hallucination_grader", _grader(hallucination))
+    monkeypatch.setattr(graph, "get_answer_grader", _grader(answer))
+    state.update(graph.grade_generation_v_documents_and_question(state))
+    return state
+
+def test_with_budget_computes_the_deadline_from_a_timeout():
+    start = time.time()
+    inputs = graph._with_budget({"question": "q", "budget": {"max_generations": 1, "timeout": 5, "deadline": 0}})
+    budget = inputs["budget"]
+    assert budget["max_generations"] == 1
+    assert budget["max_web_searches"] == graph.MAX_WEB_SEARCHES
+    assert start + 5 <= budget["deadline"] <= time.time() + 5
+    assert (inputs["generations"], inputs["web_searches"], inputs["status"]) == (0, 0, "running")
+
+def test_routing_stops_when_generations_or_time_run_out():
+    state = graph._with_budget({"question": "q", "budget": {"max_generations": 2, "max_web_searches": 0}})
+    state.update(hallucination_grade="no", generations=1)
+    assert graph.decide_generation_outcome(state) == "not supported"
+    state["generations"] = 2
+    assert graph.decide_generation_outcome(state) == "budget exhausted"
+    state.update(generations=1, budget=dict(state["budget"], deadline=time.time() - 1))
+    assert graph.decide_generation_outcome(state) == "budget exhausted"
+
+def test_budget_exhausted_returns_the_best_generation_with_its_grades(monkeypatch):
+    state = graph._with_budget({"question": "q", "budget": {"max_generations": 2}})
+    state.update(context="facts", generation="grounded but off-topic", generations=1)
+    _grade(state, monkeypatch, "yes", "no")
+    state.update(generation="ungrounded", generations=2)
+    _grade(state, monkeypatch, "no", "yes")
+    result = graph.budget_exhausted(state)
+    assert result == {"generation": "grounded but off-topic", "hallucination_grade": "yes", "answer_grade": "no",
+                      "status": "budget exhausted"}
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import numpy as np
+import pytest
+import compact_index
+from compact_index import CompactVectorIndex
+
+class _Embeddings:
+    """Deterministic random unit vectors per text, standing in for the cached sentence embeddings."""
+
+    def _vector(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(64).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+def _build(directory, n=1200, **kwargs):
+    index = CompactVectorIndex(str(directory), _Embeddings(), ivf_lists=0, **kwargs)
+    index.add_texts([f"chunk {i}" for i in range(n)], [{"row": i} for i in range(n)], ids=[f"id{i}" for i in range(n)])
+    index.save()
+    return index
+
+def _assert_aligned(index, sample):
+    # Every row's codes must belong to its own text: searching for a text finds that text first
+    for i in sample:
+        [doc] = index.similarity_search(f"chunk {i}", k=1)
+        assert doc.page_content == f"chunk {i}" and doc.metadata == {"row": i}
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_delete_without_save_is_undone_by_a_crash(tmp_path, quantization):
+    index = _build(tmp_path, quantization=quantization)
+    index.delete([f"id{i}" for i in range(400)])
+    assert len(index) == 800
+    # The process dies before save: the reloaded index is the last saved one, rows and codes still paired
+    reloaded = CompactVectorIndex(str(tmp_path), _Embeddings(), quantization=quantization, ivf_lists=0)
+    assert len(reloaded) == 1200
+    _assert_aligned(reloaded, [0, 399, 400, 1199])
+
+def test_save_compacts_deletes_into_a_new_generation(tmp_path):
+    index = _build(tmp_path)
+    index.delete([f"id{i}" for i in range(400)])
+    index.save()
+    files = sorted(os.listdir(tmp_path / "compact"))
+    assert files == ["codes.1.bin", "rows.pkl"]
+    reloaded = CompactVectorIndex(str(tmp_path), _Embeddings(), ivf_lists=0)
+    assert len(reloaded) == 800 and len(reloaded.ids) == 800
+    assert reloaded.get()["ids"][:2] == ["id400", "id401"]
+    _assert_aligned(reloaded, [400, 800, 1199])
+
+def test_crash_during_compaction_keeps_the_previous_generation(tmp_path, monkeypatch):
+    index = _build(tmp_path)
+    index.delete([f"id{i}" for i in range(400)])
+
+    def crash(*args):
+        raise OSError("killed before the row table was replaced")
+    monkeypatch.setattr(compact_index.pickle, "dump", crash)
+    with pytest.raises(OSError):
+        index.save()
+    monkeypatch.undo()
+
+    reloaded = CompactVectorIndex(str(tmp_path), _Embeddings(), ivf_lists=0)
+    assert [name for name in os.listdir(tmp_path / "compact") if name.startswith("codes")] == ["codes.0.bin"]
+    assert len(reloaded) == 1200
+    _assert_aligned(reloaded, [0, 400, 1199])
+
+def test_unsaved_appends_are_dropped_on_reload(tmp_path):
+    index = _build(tmp_path, n=10)
+    index.add_texts(["late chunk"], ids=["late"])
+    reloaded = CompactVectorIndex(str(tmp_path), _Embeddings(), ivf_lists=0)
+    assert len(reloaded) == 10
+    assert os.path.getsize(tmp_path / "compact" / "codes.0.bin") == 10 * reloaded.code_size
+    _assert_aligned(reloaded, [0, 9])
+
+class _TopicEmbeddings:
+    """Vectors on an 8-dimensional subspace of a 64-dimensional space, so neighbours are meaningful like real embeddings."""
+
+    def __init__(self, count, seed=0):
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((8, 64))
+        self.latent = rng.standard_normal((count, 8))
+        self.texts = [f"chunk {i}" for i in range(count)]
+        self._vectors = dict(zip(self.texts, self.latent @ self.projection))
+
+    def embed_documents(self, texts):
+        return [self._vectors[t].tolist() for t in texts]
+
+@pytest.mark.parametrize("quantization, ivf_lists, min_recall", [
+    ("int8", 0, 0.95), ("binary", 0, 0.9), ("int8", 16, 0.9), ("binary", 16, 0.85),
+])
+def test_compact_search_recall_against_exact_search(tmp_path, quantization, ivf_lists, min_recall):
+    embeddings = _TopicEmbeddings(1200)
+    index = CompactVectorIndex(str(tmp_path), embeddings, quantization=quantization, ivf_lists=ivf_lists,
+                               ivf_probes=4, rerank_k=32)
+    index.add_texts(embeddings.texts)
+    if ivf_lists:
+        index.train_ivf()
+    vectors = np.asarray(embeddings.embed_documents(embeddings.texts))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rng = np.random.default_rng(1)
+    hits = 0
+    for i in rng.choice(len(embeddings.texts), 50, replace=False):
+        # A question close to one chunk, like a question about a passage
+        query = (embeddings.latent[i] + 0.3 * rng.standard_normal(8)) @ embeddings.projection
+        exact = {embeddings.texts[j] for j in np.argsort(-(vectors @ (query / np.linalg.norm(query))))[:4]}
+        found = {d.page_content for d in index.similarity_search_by_vector(query.tolist(), k=4)}
+        hits += len(exact & found)
+    assert hits / 200 >= min_recall
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import pytest
+from langchain.schema import Document
+import context
+
+class _Words:
+    """Tokenizer stand-in: one token per whitespace-separated word."""
+
+    def encode(self, text):
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+@pytest.fixture(autouse=True)
+def fakes(monkeypatch):
+    # Relevance is the number of times "memory" appears in a text
+    def vector(text):
+        return [float(text.count("memory")), 1.0]
+    embeddings = SimpleNamespace(embed_query=lambda q: [1.0, 0.0],
+                                 embed_transient=lambda texts: [vector(t) for t in texts])
+    monkeypatch.setattr(context, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(context, "get_encoding", lambda: _Words())
+
+def _doc(text, source="s"):
+    return Document(page_content=text, metadata={"source": source})
+
+def test_deduplicate_drops_exact_and_near_duplicates():
+    text = "agents keep short term memory in the prompt and long term memory in a vector store"
+    docs = [_doc(text), _doc("  " + text.replace(" ", "\n")), _doc(text + " today"), _doc("tools let agents act"), _doc("   ")]
+    assert [d.page_content for d in context.deduplicate(docs, threshold=0.8)] == [text, "tools let agents act"]
+
+def test_pack_context_orders_by_relevance_and_numbers_blocks():
+    docs = [_doc("tools", "a"), _doc("memory memory", "b"), _doc("memory\n\nonce", "c")]
+    assert context.pack_context(docs, "memory") == "[1] (b)\nmemory memory\n\n[2] (c)\nmemory once\n\n[3] (a)\ntools"
+
+def test_pack_context_stops_at_the_token_budget():
+    long_text = "memory " + " ".join(f"w{i}" for i in range(100))
+    docs = [_doc(long_text, "a"), _doc("memory " + "x " * 80, "b")]
+    packed = context.pack_context(docs, "memory", budget=160)
+    blocks = packed.split("\n\n")
+    assert len(blocks) == 2
+    # The first block fits whole (102 tokens plus the separator); the 56 left are enough for a truncated tail block
+    assert blocks[0].startswith("[1] (a)") and len(blocks[0].split(" ")) == 102
+    assert blocks[1].startswith("[2] (b)") and len(blocks[1].split(" ")) == 56
+    assert context.pack_context(docs, "memory", budget=150).count("\n\n") == 0
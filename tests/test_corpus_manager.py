@@ -0,0 +1,51 @@
+import pytest
+import corpus_manager
+from corpus_manager import CollectionManager
+
+@pytest.fixture
+def opened(monkeypatch, tmp_path):
+    """Open corpora without ingesting; returns the URL sets opened and released, in order."""
+    log = {"opened": [], "released": []}
+
+    def initialize(urls=None, refresh=False, persist_directory=None, collection_name=None, **settings):
+        log["opened"].append(urls[0])
+        return f"retriever for {urls[0]}"
+
+    monkeypatch.setattr(corpus_manager, "initialize_vectorstore", initialize)
+    monkeypatch.setattr(corpus_manager, "corpus_directory", lambda urls=None, **settings: str(tmp_path / urls[0]))
+    monkeypatch.setattr(corpus_manager, "release_corpus", lambda directory: log["released"].append(directory.rsplit("/", 1)[-1]))
+    monkeypatch.setattr(corpus_manager, "release_routing_index", lambda directory: None)
+    # Every corpus is estimated at 1 MB
+    monkeypatch.setattr(CollectionManager, "_estimate_bytes", staticmethod(lambda directory, model: 2 ** 20))
+    return log
+
+def test_least_recently_used_corpus_is_evicted_and_reopened(opened):
+    manager = CollectionManager(memory_limit_mb=100, max_open=2)
+    manager.get_retriever(["a"])
+    manager.get_retriever(["b"])
+    assert manager.get_retriever(["a"]) == "retriever for a"
+    manager.get_retriever(["c"])
+    assert opened["released"] == ["b"]
+    assert [c["key"] for c in manager.stats()["corpora"]] == [manager.corpus_key(["a"]), manager.corpus_key(["c"])]
+    manager.get_retriever(["b"])
+    assert opened["opened"] == ["a", "b", "c", "b"]
+
+def test_memory_limit_evicts_down_to_the_budget(opened):
+    manager = CollectionManager(memory_limit_mb=2, max_open=10)
+    for urls in (["a"], ["b"], ["c"]):
+        manager.get_retriever(urls)
+    assert opened["released"] == ["a"]
+    assert manager.stats()["estimated_mb"] == 2.0
+
+def test_leased_corpora_are_not_evicted_until_released(opened):
+    manager = CollectionManager(memory_limit_mb=100, max_open=1)
+    with manager.lease(["a"]) as retriever:
+        assert retriever == "retriever for a"
+        manager.get_retriever(["b"])
+        assert opened["released"] == []
+        assert not manager.evict(["a"])
+        assert manager.is_open(["a"]) and manager.is_open(["b"])
+    # Releasing the lease brings the manager back under max_open
+    assert opened["released"] == ["a"]
+    assert manager.evict(["b"])
+    assert manager.stats()["open"] == 0
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+from embedding_cache import CachedEmbeddings, text_hash
+
+class _Model:
+    """Embedding model stand-in: 3-d vectors from text length, counting the texts it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def _vector(self, text):
+        return [float(len(text)), 1.0, 0.5]
+
+    def embed_documents(self, texts):
+        self.encoded.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.encoded.append(text)
+        return self._vector(text)
+
+def test_embedding_cache_encodes_each_text_once(tmp_path):
+    model = _Model()
+    embeddings = CachedEmbeddings(model, "test/model", str(tmp_path), batch_size=2)
+    first = embeddings.embed_documents(["a", "bb", "a", "ccc"])
+    assert model.encoded == ["a", "bb", "ccc"]
+    assert embeddings.embed_documents(["ccc", "bb"]) == [first[3], first[1]]
+    assert model.encoded == ["a", "bb", "ccc"]
+
+def test_transient_texts_reuse_cached_vectors_but_are_not_stored(tmp_path):
+    model = _Model()
+    embeddings = CachedEmbeddings(model, "test-model", str(tmp_path))
+    embeddings.embed_documents(["chunk"])
+    assert embeddings.embed_transient(["chunk", "web result", "web result"]) == [[5.0, 1.0, 0.5], [10.0, 1.0, 0.5], [10.0, 1.0, 0.5]]
+    assert model.encoded == ["chunk", "web result"]
+    assert len(embeddings.cached_vectors([text_hash("chunk"), text_hash("web result")])) == 1
+
+def test_embedding_cache_persists_across_instances(tmp_path):
+    CachedEmbeddings(_Model(), "test-model", str(tmp_path)).embed_documents(["alpha", "beta"])
+    model = _Model()
+    reopened = CachedEmbeddings(model, "test-model", str(tmp_path))
+    assert reopened.embed_documents(["beta", "alpha"]) == [[4.0, 1.0, 0.5], [5.0, 1.0, 0.5]]
+    assert model.encoded == []
+
+def test_embedding_cache_shares_rows_between_open_instances(tmp_path):
+    first = CachedEmbeddings(_Model(), "test-model", str(tmp_path))
+    second_model = _Model()
+    second = CachedEmbeddings(second_model, "test-model", str(tmp_path))
+    first.embed_documents(["shared"])
+    second.embed_documents(["own"])
+    assert second.embed_documents(["shared"]) == [[6.0, 1.0, 0.5]]
+    assert second_model.encoded == ["own"]
+
+def test_embedding_query_cache(tmp_path):
+    model = _Model()
+    embeddings = CachedEmbeddings(model, "test-model", str(tmp_path), query_cache_size=1)
+    embeddings.embed_query("q1")
+    embeddings.embed_query("q1")
+    embeddings.embed_query("q2")
+    embeddings.embed_query("q1")
+    assert model.encoded == ["q1", "q2", "q1"]
+
+def test_cached_vectors_skip_unknown_hashes(tmp_path):
+    embeddings = CachedEmbeddings(_Model(), "test-model", str(tmp_path))
+    embeddings.embed_documents(["alpha", "beta"])
+    vectors = embeddings.cached_vectors([text_hash("alpha"), text_hash("unknown")])
+    assert vectors.dtype == np.float32 and vectors.tolist() == [[5.0, 1.0, 0.5]]
+
+def test_cache_hits_do_not_wait_for_an_encoding_batch(tmp_path):
+    release = threading.Event()
+
+    class _SlowModel(_Model):
+        def embed_documents(self, texts):
+            if "slow" in texts:
+                release.wait(5)
+            return super().embed_documents(texts)
+
+    embeddings = CachedEmbeddings(_SlowModel(), "test-model", str(tmp_path))
+    embeddings.embed_documents(["cached"])
+    encoding = threading.Thread(target=embeddings.embed_documents, args=(["slow"],))
+    encoding.start()
+    try:
+        # Served while the other thread is still inside the model
+        assert embeddings.embed_documents(["cached"]) == [[6.0, 1.0, 0.5]]
+        assert encoding.is_alive()
+    finally:
+        release.set()
+        encoding.join()
+    assert embeddings.embed_documents(["slow"]) == [[4.0, 1.0, 0.5]]
@@ -0,0 +1,71 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import fetcher
+
+PAGE = b"<html lang='en'><head><title>Agents</title></head><body>LLM powered agents</body></html>"
+ETAG = '"v1"'
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def test_conditional_get_reuses_cached_body(server, tmp_path):
+    url = _url(server, "/page")
+    session = requests.Session()
+    html, meta = fetcher.fetch_url(url, cache_dir=str(tmp_path), session=session)
+    assert "LLM powered agents" in html
+    assert meta["etag"] == ETAG and not meta["not_modified"]
+
+    html_again, meta_again = fetcher.fetch_url(url, cache_dir=str(tmp_path), session=session)
+    assert html_again == html
+    assert meta_again["not_modified"]
+    assert server.requests == [("/page", None), ("/page", ETAG)]
+
+def test_fetch_documents_skips_failures(server, tmp_path):
+    urls = [_url(server, "/page"), _url(server, "/missing"), "http://127.0.0.1:1/unreachable"]
+    documents = fetcher.fetch_documents(urls, cache_dir=str(tmp_path), timeout=2, session=requests.Session())
+    assert [d.metadata["source"] for d in documents] == [urls[0]]
+    assert documents[0].metadata["title"] == "Agents"
+    assert documents[0].metadata["etag"] == ETAG
+
+def test_fetch_documents_can_fail_the_batch(server, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_documents([_url(server, "/missing")], cache_dir=str(tmp_path), skip_failures=False,
+                                session=requests.Session())
+
+def test_iter_fetch_documents_yields_none_for_failures(server, tmp_path):
+    urls = [_url(server, "/page"), _url(server, "/missing")]
+    results = dict(fetcher.iter_fetch_documents(urls, cache_dir=str(tmp_path), session=requests.Session()))
+    assert results[urls[0]].page_content.strip().endswith("LLM powered agents")
+    assert results[urls[1]] is None
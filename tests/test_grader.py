@@ -0,0 +1,75 @@
+import time
+from types import SimpleNamespace
+import numpy as np
+from langchain.schema import Document
+import grader
+import graph
+
+def _docs(n):
+    return [Document(page_content=f"chunk {i}") for i in range(n)]
+
+def test_prefilter_settles_scores_outside_the_ambiguous_band(monkeypatch):
+    monkeypatch.setattr(grader, "prefilter_scores", lambda question, documents: np.array([0.95, 0.8, 0.5, 0.1, 0.02]))
+    grades = grader.prefilter_documents("q", _docs(5), accept=0.8, reject=0.1)
+    assert grades == ["yes", "yes", None, "no", "no"]
+
+def test_grade_documents_counts_only_prefilter_grades_as_saved(monkeypatch):
+    documents = _docs(5)
+    monkeypatch.setattr(graph, "get_document_grader", lambda: None)
+    monkeypatch.setattr(graph, "prefilter_documents", lambda question, docs: ["yes", "no", None, None, None])
+    monkeypatch.setattr(graph, "GRADER_MIN_RELEVANT", 0)
+
+    def fake_concurrent(retrieval_grader, question, docs, min_relevant=0, stats=None):
+        # One call completes, one times out, one is skipped
+        stats.update(llm_graded=1, timed_out=1, skipped=1)
+        return ["yes", None, None]
+
+    monkeypatch.setattr(graph, "grade_documents_concurrently", fake_concurrent)
+    result = graph.grade_documents({"question": "q", "documents": documents})
+    stats = result["grading_stats"]
+    assert stats["llm_calls_saved"] == 2
+    assert (stats["timed_out"], stats["skipped"]) == (1, 1)
+    assert result["documents"] == [documents[0], documents[2]]
+
+def test_grade_documents_reports_skips_when_prefilter_meets_min_relevant(monkeypatch):
+    monkeypatch.setattr(graph, "get_document_grader", lambda: None)
+    monkeypatch.setattr(graph, "prefilter_documents", lambda question, docs: ["yes", "yes", None, "no"])
+    monkeypatch.setattr(graph, "GRADER_MIN_RELEVANT", 2)
+    result = graph.grade_documents({"question": "q", "documents": _docs(4)})
+    stats = result["grading_stats"]
+    assert (stats["llm_calls_saved"], stats["llm_graded"], stats["skipped"]) == (3, 0, 1)
+    assert len(result["documents"]) == 2
+
+class _Grader:
+    """Document grader stand-in: grades by chunk text, sleeping on the chunks listed in `slow`."""
+
+    def __init__(self, grades, slow=(), delay=1.0):
+        self.grades = grades
+        self.slow = set(slow)
+        self.delay = delay
+
+    def invoke(self, inputs):
+        text = inputs["document"]
+        if text in self.slow:
+            time.sleep(self.delay)
+        return SimpleNamespace(binary_score=self.grades[text])
+
+def test_concurrent_grading_abandons_calls_past_the_timeout():
+    documents = _docs(3)
+    retrieval_grader = _Grader({"chunk 0": "yes", "chunk 1": "no", "chunk 2": "yes"}, slow=["chunk 1"])
+    stats = {}
+    started = time.monotonic()
+    grades = grader.grade_documents_concurrently(retrieval_grader, "q", documents, max_concurrency=3,
+                                                 timeout=0.2, stats=stats)
+    assert time.monotonic() - started < 0.8
+    assert grades == ["yes", None, "yes"]
+    assert (stats["llm_graded"], stats["timed_out"], stats["skipped"]) == (2, 1, 0)
+
+def test_concurrent_grading_stops_once_enough_documents_are_relevant():
+    documents = _docs(4)
+    retrieval_grader = _Grader({f"chunk {i}": "yes" for i in range(4)}, slow=["chunk 2", "chunk 3"])
+    stats = {}
+    grades = grader.grade_documents_concurrently(retrieval_grader, "q", documents, max_concurrency=4,
+                                                 timeout=5, min_relevant=2, stats=stats)
+    assert grades == ["yes", "yes", None, None]
+    assert (stats["llm_graded"], stats["timed_out"], stats["skipped"]) == (2, 0, 2)
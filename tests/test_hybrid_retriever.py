@@ -0,0 +1,41 @@
+from langchain.schema import Document
+from bm25 import BM25Index
+from hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+def _doc(text, source="https://example.com"):
+    return Document(page_content=text, metadata={"source": source})
+
+def test_rrf_ranks_documents_found_by_both_retrievers_first():
+    a, b, c, d = _doc("a"), _doc("b"), _doc("c"), _doc("d")
+    fused = reciprocal_rank_fusion([[a, b, c], [d, c, b]], rrf_k=60)
+    assert [doc.page_content for doc in fused] == ["b", "c", "a", "d"]
+
+def test_rrf_deduplicates_by_source_and_content():
+    fused = reciprocal_rank_fusion([[_doc("same")], [_doc("same")], [_doc("same", source="other")]])
+    assert len(fused) == 2
+    assert fused[0].metadata["source"] == "https://example.com"
+
+def test_bm25_ranks_by_term_relevance_and_follows_deletes():
+    index = BM25Index()
+    index.add(["1", "2", "3"], [_doc("task decomposition for agents"), _doc("prompt engineering tips"),
+                                _doc("agents agents and tool use")])
+    assert [chunk_id for chunk_id, _ in index.search("agents", k=3)] == ["3", "1"]
+    index.delete(["3"])
+    assert [chunk_id for chunk_id, _ in index.search("agents", k=3)] == ["1"]
+    assert len(index) == 2
+
+class _VectorStore:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def similarity_search(self, query, k=4):
+        return self.documents[:k]
+
+def test_hybrid_retriever_fuses_dense_and_sparse_results():
+    chunks = [_doc("adversarial attacks on llms"), _doc("agent memory and planning"), _doc("prompt engineering")]
+    index = BM25Index()
+    index.add(["0", "1", "2"], chunks)
+    # Dense side ranks the memory chunk second; BM25 ranks it first, so fusion puts it on top
+    retriever = HybridRetriever(vectorstore=_VectorStore([chunks[2], chunks[1]]), bm25=index, k=2, use_mmr=False)
+    results = retriever.invoke("agent memory")
+    assert [d.page_content for d in results] == ["agent memory and planning", "prompt engineering"]
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from langchain.schema import Document
+import ingest_pipeline
+from ingest_pipeline import threaded, split_pages, embed_pages
+
+def _paragraphs(documents, chunk_size=250, chunk_overlap=0):
+    return [Document(page_content=p, metadata=dict(d.metadata)) for d in documents for p in d.page_content.split("\n\n")]
+
+def _pages(*texts):
+    return [{"url": f"http://{i}", "docs": [Document(page_content=t, metadata={"source": i})]} for i, t in enumerate(texts)]
+
+def test_threaded_stage_blocks_when_the_consumer_falls_behind():
+    produced, closed = [], []
+
+    def stage():
+        try:
+            for i in range(100):
+                produced.append(i)
+                yield i
+        finally:
+            closed.append(True)
+
+    items = threaded(stage(), maxsize=2)
+    assert next(items) == 0
+    time.sleep(0.3)
+    # Two items wait in the queue and one more is held by the blocked put
+    assert len(produced) <= 4
+    items.close()
+    time.sleep(0.3)
+    assert closed == [True] and len(produced) <= 4
+
+def test_threaded_stage_reraises_errors_in_the_consumer():
+    def stage():
+        yield 1
+        raise ValueError("fetch failed")
+
+    items = threaded(stage(), maxsize=1)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="fetch failed"):
+        next(items)
+
+class _BrokenPool:
+    """Process pool whose workers die: every submitted split fails."""
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+def test_split_pages_falls_back_to_in_thread_splitting(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "split_documents", _paragraphs)
+    monkeypatch.setattr(ingest_pipeline, "_split_executor", _BrokenPool())
+    pages = list(split_pages(iter(_pages("a\n\nb", "c", "d\n\ne")), executor=ingest_pipeline._split_executor))
+    assert [[c.page_content for c in p["chunks"]] for p in pages] == [["a", "b"], ["c"], ["d", "e"]]
+    # Later syncs split in-thread without trying the pool again
+    assert ingest_pipeline.get_split_executor() is None
+
+def test_embed_pages_batches_chunks_across_pages():
+    batches = []
+
+    class _Embeddings:
+        def embed_documents(self, texts):
+            batches.append(list(texts))
+
+    pages = _pages("a", "b", "c")
+    for page in pages:
+        page["chunks"] = _paragraphs(page["docs"])
+    assert list(embed_pages(iter(pages), _Embeddings(), batch_size=2)) == pages
+    assert batches == [["a", "b"], ["c"]]
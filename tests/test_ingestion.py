@@ -0,0 +1,86 @@
+import pytest
+from langchain.schema import Document
+import ingestion
+from bm25 import BM25Index
+
+class _Store:
+    """Vectorstore stand-in keeping chunks by ID."""
+
+    def __init__(self):
+        self.chunks = {}
+
+    def add_documents(self, documents, ids):
+        self.chunks.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+
+@pytest.fixture
+def pages(monkeypatch):
+    """URL -> page text served to the sync; a None text fails the fetch. Returns the dict and the fetch log."""
+    content, fetched = {}, []
+
+    def fetch(urls):
+        for url in urls:
+            fetched.append(url)
+            text = content.get(url)
+            yield url, Document(page_content=text, metadata={"source": url}) if text is not None else None
+
+    def split(pages, chunk_size, chunk_overlap, executor=None):
+        for page in pages:
+            page["chunks"] = [Document(page_content=p, metadata=dict(page["docs"][0].metadata))
+                              for p in page["docs"][0].page_content.split("\n\n")]
+            yield page
+
+    monkeypatch.setattr(ingestion, "iter_web_documents", fetch)
+    monkeypatch.setattr(ingestion, "split_pages", split)
+    return content, fetched
+
+def _sync(store, manifest, bm25, urls, refresh=False):
+    return ingestion.sync_vectorstore(store, manifest, urls=urls, refresh=refresh, bm25=bm25)
+
+def test_sync_adds_new_urls_and_removes_dropped_ones(pages):
+    content, fetched = pages
+    content.update({"http://a": "alpha one\n\nalpha two", "http://b": "beta", "http://c": "gamma"})
+    store, bm25, manifest = _Store(), BM25Index(), {"version": 0, "sources": {}}
+    assert _sync(store, manifest, bm25, ["http://a", "http://b"]) == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0}
+    assert len(store.chunks) == 3 and manifest["version"] == 1
+
+    fetched.clear()
+    stats = _sync(store, manifest, bm25, ["http://a", "http://c"])
+    assert stats == {"added": 1, "updated": 0, "removed": 1, "unchanged": 1}
+    assert fetched == ["http://c"]
+    assert sorted(d.page_content for d in store.chunks.values()) == ["alpha one", "alpha two", "gamma"]
+    assert set(manifest["sources"]) == {"http://a", "http://c"}
+    assert len(bm25) == 3 and manifest["version"] == 2
+
+def test_refresh_reembeds_only_changed_pages(pages):
+    content, _ = pages
+    content.update({"http://a": "alpha", "http://b": "beta one\n\nbeta two"})
+    store, bm25, manifest = _Store(), BM25Index(), {"version": 0, "sources": {}}
+    _sync(store, manifest, bm25, ["http://a", "http://b"])
+    unchanged_ids = list(manifest["sources"]["http://a"]["chunk_ids"])
+
+    content["http://b"] = "beta three"
+    stats = _sync(store, manifest, bm25, ["http://a", "http://b"], refresh=True)
+    assert stats == {"added": 0, "updated": 1, "removed": 0, "unchanged": 1}
+    assert manifest["sources"]["http://a"]["chunk_ids"] == unchanged_ids
+    assert sorted(d.page_content for d in store.chunks.values()) == ["alpha", "beta three"]
+
+    assert _sync(store, manifest, bm25, ["http://a", "http://b"], refresh=True)["unchanged"] == 2
+    assert manifest["version"] == 2
+
+def test_failed_fetches_and_web_results_keep_their_chunks(pages):
+    content, _ = pages
+    content["http://a"] = "alpha"
+    store, bm25, manifest = _Store(), BM25Index(), {"version": 0, "sources": {}}
+    _sync(store, manifest, bm25, ["http://a"])
+    manifest["sources"]["web:http://w"] = {"origin": "websearch", "chunk_ids": ["w-0"]}
+    store.chunks["w-0"] = Document(page_content="web")
+
+    content["http://a"] = None
+    stats = _sync(store, manifest, bm25, ["http://a"], refresh=True)
+    assert stats == {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    assert sorted(d.page_content for d in store.chunks.values()) == ["alpha", "web"]
+    assert "web:http://w" in manifest["sources"]
@@ -0,0 +1,45 @@
+import pytest
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage
+from llm_cache import LLMResponseCache
+
+class Grade(BaseModel):
+    binary_score: str
+
+@pytest.fixture
+def llm_cache(tmp_path):
+    return LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite"), max_entries=20)
+
+def test_llm_cache_round_trips_messages_and_structured_output(llm_cache):
+    llm_cache.put("chat", AIMessage(content="hello"), latency=0.5, model="m")
+    llm_cache.put("grade", Grade(binary_score="yes"), latency=0.25, model="m", schema=Grade)
+    assert llm_cache.get("chat").content == "hello"
+    assert llm_cache.get("grade", Grade) == Grade(binary_score="yes")
+    assert llm_cache.get("unknown") is None
+    stats = llm_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_seconds"]) == (2, 1, 0.75)
+
+def test_llm_cache_keys_cover_model_temperature_and_schema():
+    keys = {
+        LLMResponseCache.make_key("prompt", "m1"),
+        LLMResponseCache.make_key("prompt", "m2"),
+        LLMResponseCache.make_key("prompt", "m1", temperature=0.7),
+        LLMResponseCache.make_key("prompt", "m1", schema=Grade),
+        LLMResponseCache.make_key("other prompt", "m1"),
+    }
+    assert len(keys) == 5
+    assert LLMResponseCache.make_key("prompt", "m1") == LLMResponseCache.make_key("prompt", "m1")
+
+def test_llm_cache_evicts_least_recently_used_and_persists(llm_cache):
+    for i in range(25):
+        llm_cache.put(f"k{i}", AIMessage(content=str(i)), latency=0.1)
+        llm_cache.get("k0")  # keep the first entry recently used
+    assert llm_cache.stats()["entries"] <= 20
+    reopened = LLMResponseCache(path=llm_cache.path, max_entries=20)
+    assert reopened.get("k0").content == "0"
+    assert reopened.get("k1") is None
+    assert reopened.get("k24").content == "24"
+
+def test_llm_cache_keys_regeneration_attempts_apart():
+    assert LLMResponseCache.make_key("prompt", "m1", attempt=0) == LLMResponseCache.make_key("prompt", "m1")
+    assert LLMResponseCache.make_key("prompt", "m1", attempt=1) != LLMResponseCache.make_key("prompt", "m1")
@@ -0,0 +1,127 @@
+import time
+import threading
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+import llm_gateway
+from llm_cache import LLMResponseCache
+from llm_gateway import LLMGateway, TokenBucket, _Provider
+from telemetry import LLMUsageCallback, _current_node
+
+class RateLimitError(Exception):
+    """Named like the provider SDK error the gateway treats as retryable."""
+
+class _Model:
+    """Chat model stand-in answering with `name`, after raising the queued errors."""
+
+    def __init__(self, name, errors=()):
+        self.name = name
+        self.errors = list(errors)
+        self.calls = 0
+        self.runnable = RunnableLambda(self._call)
+
+    def _call(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content=f"{self.name} answer")
+
+def _provider(model):
+    return _Provider(model.name, model.runnable)
+
+PROMPT = ChatPromptTemplate.from_template("Answer: {question}")
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "_backoff", lambda attempt, error: 0.0)
+
+def test_token_bucket_admits_burst_then_refuses_without_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.acquire() and bucket.acquire()
+    assert not bucket.acquire(max_wait=0)
+    start = time.monotonic()
+    assert bucket.acquire(max_wait=1)
+    assert 0.05 <= time.monotonic() - start < 0.5
+
+def test_token_bucket_refund_returns_tokens():
+    bucket = TokenBucket(rate=0.001, capacity=1)
+    assert bucket.acquire(max_wait=0)
+    bucket.refund()
+    assert bucket.acquire(max_wait=0)
+
+def test_retryable_errors_are_retried_on_the_same_provider():
+    primary, backup = _Model("groq", [RateLimitError(), RateLimitError()]), _Model("gemini")
+    gateway = LLMGateway([_provider(primary), _provider(backup)], max_retries=3)
+    assert (PROMPT | gateway.runnable()).invoke({"question": "q"}).content == "groq answer"
+    assert (primary.calls, backup.calls) == (3, 0)
+
+def test_fails_over_when_retries_run_out():
+    primary, backup = _Model("groq", [RateLimitError()] * 3), _Model("gemini")
+    gateway = LLMGateway([_provider(primary), _provider(backup)], max_retries=1)
+    assert (PROMPT | gateway.runnable()).invoke({"question": "q"}).content == "gemini answer"
+    assert (primary.calls, backup.calls) == (2, 1)
+
+def test_non_retryable_errors_fail_over_immediately():
+    primary, backup = _Model("groq", [ValueError("bad request")]), _Model("gemini")
+    gateway = LLMGateway([_provider(primary), _provider(backup)], max_retries=3)
+    assert (PROMPT | gateway.runnable()).invoke({"question": "q"}).content == "gemini answer"
+    assert primary.calls == 1
+
+def test_fails_over_when_bucket_stays_empty():
+    primary, backup = _Model("groq"), _Model("gemini")
+    limited = _provider(primary)
+    limited.requests = TokenBucket(rate=0.001, capacity=1)
+    limited.requests.tokens = 0
+    gateway = LLMGateway([limited, _provider(backup)], max_queue_wait=0.01)
+    assert (PROMPT | gateway.runnable()).invoke({"question": "q"}).content == "gemini answer"
+    assert primary.calls == 0
+
+def test_last_error_is_raised_when_every_provider_fails():
+    primary, backup = _Model("groq", [ValueError("bad request")]), _Model("gemini", [KeyError("down")])
+    gateway = LLMGateway([_provider(primary), _provider(backup)])
+    with pytest.raises(KeyError):
+        (PROMPT | gateway.runnable()).invoke({"question": "q"})
+
+class _Tokens(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.append(token)
+
+def test_cache_hits_skip_the_provider_and_still_stream(tmp_path):
+    model = _Model("groq")
+    gateway = LLMGateway([_provider(model)], cache=LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite")))
+    chain = PROMPT | gateway.runnable()
+    assert chain.invoke({"question": "q"}).content == "groq answer"
+    handler = _Tokens()
+    assert chain.invoke({"question": "q"}, config={"callbacks": [handler]}).content == "groq answer"
+    assert model.calls == 1
+    assert handler.tokens == ["groq answer"]
+    assert gateway.cache.stats()["hits"] == 1
+
+def test_cache_replays_are_not_counted_as_llm_calls(tmp_path):
+    gateway = LLMGateway([_provider(_Model("groq"))], cache=LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite")))
+    chain = PROMPT | gateway.runnable()
+    chain.invoke({"question": "q"})
+    record = {"node": "generate", "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "lock": threading.Lock()}
+    token = _current_node.set(record)
+    try:
+        handler = _Tokens()
+        chain.invoke({"question": "q"}, config={"callbacks": [handler, LLMUsageCallback()]})
+    finally:
+        _current_node.reset(token)
+    assert handler.tokens == ["groq answer"]
+    assert record["llm_calls"] == 0
+
+def test_regeneration_attempts_bypass_earlier_cached_answers(tmp_path):
+    model = _Model("groq")
+    gateway = LLMGateway([_provider(model)], cache=LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite")))
+    chain = PROMPT | gateway.runnable()
+    chain.invoke({"question": "q"})
+    chain.invoke({"question": "q"}, config={"configurable": {"generation_attempt": 1}})
+    assert model.calls == 2
+    chain.invoke({"question": "q"}, config={"configurable": {"generation_attempt": 1}})
+    assert model.calls == 2
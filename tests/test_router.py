@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from langchain_core.runnables import RunnableLambda
+import router
+
+# Question -> query vector; the corpus holds chunks along the first two axes
+QUERIES = {
+    "on topic": [1.0, 0.0, 0.0],
+    "half way": [0.6, 0.0, 0.8],
+    "off topic": [0.0, 0.0, 1.0],
+}
+
+@pytest.fixture
+def local_router(monkeypatch):
+    """Route against a fixed corpus; returns the list of questions the LLM router was asked."""
+    asked = []
+    corpus = np.array([[1.0, 0.0, 0.0], [0.96, 0.28, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+    monkeypatch.setattr(router, "_corpus_vectors", lambda persist_directory: corpus)
+    monkeypatch.setattr(router, "get_embeddings", lambda: SimpleNamespace(embed_query=lambda q: list(QUERIES[q])))
+    monkeypatch.setattr(router, "corpus_version", lambda persist_directory: 1)
+    monkeypatch.setattr(router, "get_question_router", lambda: RunnableLambda(
+        lambda inputs: asked.append(inputs["question"]) or SimpleNamespace(datasource="websearch")))
+    monkeypatch.setattr(router, "ROUTER_LOCAL_ENABLED", True)
+    monkeypatch.setattr(router, "ROUTER_TOP_K", 2)
+    monkeypatch.setattr(router, "ROUTER_VECTORSTORE_THRESHOLD", 0.8)
+    monkeypatch.setattr(router, "ROUTER_WEBSEARCH_THRESHOLD", 0.2)
+    monkeypatch.setattr(router, "_route_cache", router.OrderedDict())
+    return asked
+
+def test_local_router_decides_outside_the_uncertain_band(local_router):
+    assert router.route_question_locally("on topic", "corpus") == ("vectorstore", pytest.approx(0.98))
+    assert router.route_question_locally("off topic", "corpus") == ("websearch", pytest.approx(0.0))
+    assert router.route_question_locally("half way", "corpus") == (None, pytest.approx(0.588))
+
+def test_get_route_asks_the_llm_only_when_uncertain(local_router):
+    assert router.get_route("on topic", "corpus") == "vectorstore"
+    assert router.get_route("off topic", "corpus") == "websearch"
+    assert local_router == []
+    assert router.get_route("half way", "corpus") == "websearch"
+    assert local_router == ["half way"]
+
+def test_get_route_caches_decisions_per_corpus_version(local_router, monkeypatch):
+    router.get_route("half way", "corpus")
+    router.get_route("  Half  way?", "corpus")
+    assert local_router == ["half way"]
+    monkeypatch.setattr(router, "corpus_version", lambda persist_directory: 2)
+    router.get_route("half way", "corpus")
+    assert local_router == ["half way", "half way"]
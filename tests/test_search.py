@@ -0,0 +1,26 @@
+import search
+
+class _Tool:
+    def __init__(self):
+        self.queries = []
+
+    def invoke(self, payload):
+        self.queries.append(payload["query"])
+        return {"results": [{"url": "https://example.com", "content": f"result for {payload['query']}"}]}
+
+def test_results_are_cached_within_ttl(tmp_path):
+    tool = _Tool()
+    first = search.search_web("What is an agent?", tool=tool, cache_dir=str(tmp_path), ttl=60)
+    # Case and whitespace differences share the cache entry
+    second = search.search_web("  what is an AGENT? ", tool=tool, cache_dir=str(tmp_path), ttl=60)
+    assert first == second
+    assert tool.queries == ["What is an agent?"]
+
+def test_expired_results_are_fetched_again(tmp_path):
+    tool = _Tool()
+    search.search_web("agent memory", tool=tool, cache_dir=str(tmp_path), ttl=60)
+    search.search_web("agent memory", tool=tool, cache_dir=str(tmp_path), ttl=0)
+    assert tool.queries == ["agent memory", "agent memory"]
+    # The refetch refreshed the entry, so a normal TTL serves it again
+    search.search_web("agent memory", tool=tool, cache_dir=str(tmp_path), ttl=60)
+    assert len(tool.queries) == 2
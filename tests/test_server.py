@@ -0,0 +1,85 @@
+import asyncio
+from contextlib import contextmanager
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+import server
+
+@pytest.mark.parametrize("budget", [
+    {"deadline": 0},
+    {"max_generations": server.MAX_GENERATIONS + 1},
+    {"max_web_searches": -1},
+    {"timeout": server.REQUEST_DEADLINE_SECONDS * 2},
+])
+def test_ask_request_rejects_budgets_beyond_the_server_limits(budget):
+    with pytest.raises(ValidationError):
+        server.AskRequest(question="q", budget=budget)
+
+def test_ask_request_accepts_tighter_budgets():
+    request = server.AskRequest(question="q", budget={"max_generations": 1, "timeout": 1.5})
+    assert request.budget.model_dump(exclude_none=True) == {"max_generations": 1, "timeout": 1.5}
+
+class _Corpora:
+    """Collection manager stand-in with every corpus already open."""
+
+    def is_open(self, urls=None):
+        return True
+
+    @contextmanager
+    def lease(self, urls=None):
+        yield None
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Count workflow runs; each finishes once the test sets the returned event."""
+    started, release = [], asyncio.Event()
+
+    async def fake_workflow(inputs, retriever=None):
+        started.append(inputs["question"])
+        await release.wait()
+        yield {"type": "node", "node": "generate", "update": {}}
+        yield {"type": "done", "result": {"question": inputs["question"], "generation": "answer", "documents": []}}
+
+    monkeypatch.setattr(server, "astream_workflow", fake_workflow)
+    monkeypatch.setattr(server, "get_collection_manager", lambda: _Corpora())
+    return started, release
+
+async def _collect(job):
+    return [event async for event in job.subscribe()]
+
+def test_identical_questions_share_one_run_and_overflow_is_rejected(runs):
+    started, release = runs
+
+    async def scenario():
+        service = server.WorkflowService(max_concurrency=1, max_queue=0)
+        first = service.submit(server.AskRequest(question="What is agent memory?"))
+        second = service.submit(server.AskRequest(question="what is  agent memory"))
+        assert second is first
+        with pytest.raises(server.ServiceOverloaded):
+            service.submit(server.AskRequest(question="Another question"))
+        await asyncio.sleep(0.05)
+        late = service.submit(server.AskRequest(question="What is agent memory?"))
+        release.set()
+        results = await asyncio.gather(_collect(first), _collect(late))
+        await asyncio.sleep(0)
+        return service, results
+
+    service, results = asyncio.run(scenario())
+    assert started == ["What is agent memory?"]
+    # A subscriber that joined after the run started replays its events
+    assert results[0] == results[1] and [e["type"] for e in results[0]] == ["node", "done"]
+    assert service.stats() == {"running": 0, "queued": 0, "inflight_questions": 0}
+
+def test_ask_returns_503_with_retry_after_when_the_queue_is_full(runs, monkeypatch):
+    _, release = runs
+
+    async def scenario():
+        monkeypatch.setattr(server, "service", server.WorkflowService(max_concurrency=1, max_queue=0))
+        server.service.submit(server.AskRequest(question="busy"))
+        with pytest.raises(HTTPException) as error:
+            await server.ask(server.AskRequest(question="rejected"))
+        release.set()
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503 and error.headers["Retry-After"] == "1"
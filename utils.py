@@ -1,21 +1,24 @@
-from langchain_community.document_loaders import WebBaseLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
 from dotenv import load_dotenv
 import os
 import logging
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
+from config import DEFAULT_URLS, EMBEDDING_CACHE_DIR, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS
+from fetcher import fetch_documents, iter_fetch_documents
+from embedding_cache import CachedEmbeddings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Heavy dependencies (torch/sentence-transformers, the LLM SDKs, the text splitter) are imported on
+# first use so importing this module stays cheap; see warmup.py for loading them ahead of requests.
+
 # Singleton LLM instance
 _groq_llm = None
 _gemini_llm = None
 
+# Embedding models already loaded in this process, keyed by model name
+_embeddings = {}
+
 def load_environment():
     """Load environment variables from .env file and return a dictionary of required keys."""
     try:
@@ -39,6 +42,7 @@ def initialize_llm_groq():
     """Initialize and return a singleton ChatGroq LLM instance."""
     global _groq_llm
     if _groq_llm is None:
+        from langchain_groq import ChatGroq
         env_vars = load_environment()
         _groq_llm = ChatGroq(
             model="llama-3.3-70b-versatile",
@@ -52,6 +56,7 @@ def initialize_llm_gemini():
     """Initialize and return a singleton ChatGoogleGenerativeAI LLM instance."""
     global _gemini_llm
     if _gemini_llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
         env_vars = load_environment()
         _gemini_llm = ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
@@ -61,26 +66,27 @@ def initialize_llm_gemini():
         logger.info("ChatGoogleGenerativeAI LLM initialized")
     return _gemini_llm
 
-def load_web_documents(urls=None):
-    """Load documents from a list of URLs. Returns a list of documents."""
-    default_urls = [
-        "https://lilianweng.github.io/posts/2023-06-23-agent/",
-        "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
-        "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
-    ]
-    urls = urls or default_urls
+def load_web_documents(urls=None, skip_failures=True):
+    """Load documents from a list of URLs concurrently. URLs that fail are skipped unless skip_failures is False."""
+    urls = urls or DEFAULT_URLS
     try:
         logger.info(f"Loading documents from URLs: {urls}")
-        docs = [WebBaseLoader(url).load() for url in urls]
-        docs_list = [item for sublist in docs for item in sublist]
+        docs_list = fetch_documents(urls, skip_failures=skip_failures)
         logger.info(f"Loaded {len(docs_list)} documents")
         return docs_list
     except Exception as e:
         logger.error(f"Failed to load documents: {str(e)}")
         raise
 
+def iter_web_documents(urls=None):
+    """Yield (url, Document) pairs as pages finish loading; failed URLs come with None."""
+    urls = urls or DEFAULT_URLS
+    logger.info(f"Streaming documents from {len(urls)} URLs")
+    return iter_fetch_documents(urls)
+
 def split_documents(documents, chunk_size=250, chunk_overlap=0):
     """Split documents into chunks for vectorstore processing."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     try:
         logger.info(f"Splitting {len(documents)} documents with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
         text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
@@ -93,38 +99,20 @@ def split_documents(documents, chunk_size=250, chunk_overlap=0):
         logger.error(f"Failed to split documents: {str(e)}")
         raise
 
-def get_embeddings(model_name="all-MiniLM-L6-v2"):
-    """Initialize and return HuggingFace embeddings model."""
+def get_embeddings(model_name="all-MiniLM-L6-v2", batch_size=EMBEDDING_BATCH_SIZE, num_threads=EMBEDDING_THREADS):
+    """Return a process-wide HuggingFace embeddings model wrapped in the on-disk embedding cache."""
+    if model_name in _embeddings:
+        return _embeddings[model_name]
     try:
         logger.info(f"Initializing embeddings model: {model_name}")
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        from langchain.embeddings import HuggingFaceEmbeddings
+        model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+        _embeddings[model_name] = CachedEmbeddings(model, model_name, EMBEDDING_CACHE_DIR, batch_size=batch_size)
         logger.info("Embeddings model initialized successfully")
-        return embeddings
+        return _embeddings[model_name]
     except Exception as e:
         logger.error(f"Failed to initialize embeddings: {str(e)}")
         raise
-
-def initialize_vectorstore(urls=None, chunk_size=250, chunk_overlap=0, embedding_model="all-MiniLM-L6-v2"):
-    """Initialize Chroma vectorstore with documents from URLs."""
-    try:
-        logger.info("Initializing vectorstore")
-        # Load documents
-        documents = load_web_documents(urls)
-        
-        # Split documents
-        doc_splits = split_documents(documents, chunk_size, chunk_overlap)
-        
-        # Initialize embeddings
-        embeddings = get_embeddings(embedding_model)
-        
-        # Create vectorstore
-        vectorstore = Chroma.from_documents(
-            documents=doc_splits,
-            collection_name="adv-rag-chroma",
-            embedding=embeddings,
-        )
-        logger.info("Vectorstore initialized successfully")
-        return vectorstore.as_retriever()
-    except Exception as e:
-        logger.error(f"Failed to initialize vectorstore: {str(e)}")
-        raise
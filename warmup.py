@@ -0,0 +1,111 @@
+import time
+import json
+import asyncio
+import logging
+import threading
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# Reference point for startup measurements: the serving entry point imports this module first
+PROCESS_STARTED = time.time()
+
+# Warm-up steps in order; a failure in an essential step leaves the process not ready
+STEPS = ("embeddings", "index", "graph", "tokenizer", "chains")
+ESSENTIAL_STEPS = ("embeddings", "index", "graph")
+
+_state = {"started_at": None, "interactive_s": None, "ready_s": None, "ready": False, "errors": {}, "steps": {}}
+_done = threading.Event()
+_thread = None
+_lock = threading.Lock()
+
+def _load_embeddings(urls):
+    from utils import get_embeddings
+    # The first encode pulls in torch and the model weights
+    get_embeddings().embed_query("warm-up")
+
+def _open_index(urls):
+    from corpus_manager import get_collection_manager
+    get_collection_manager().open(urls)
+
+def _compile_graph(urls):
+    from graph import get_app
+    get_app()
+
+def _load_tokenizer(urls):
+    from context import get_encoding
+    get_encoding()
+
+def _build_chains(urls):
+    from router import get_question_router
+    from generator import get_rag_chain
+    from grader import get_document_grader, get_hallucination_grader, get_answer_grader
+    for factory in (get_question_router, get_rag_chain, get_document_grader, get_hallucination_grader, get_answer_grader):
+        factory()
+
+_STEP_FUNCTIONS = {
+    "embeddings": _load_embeddings,
+    "index": _open_index,
+    "graph": _compile_graph,
+    "tokenizer": _load_tokenizer,
+    "chains": _build_chains,
+}
+
+def _run(urls):
+    for step in STEPS:
+        start = time.perf_counter()
+        try:
+            _STEP_FUNCTIONS[step](urls)
+        except Exception as e:
+            logger.error(f"Warm-up step {step} failed: {e}")
+            _state["errors"][step] = str(e)
+        duration = time.perf_counter() - start
+        _state["steps"][step] = round(duration, 3)
+        metrics.observe("rag_startup_step_seconds", duration, labels={"step": step}, help_text="Warm-up step wall time")
+    _state["ready"] = not any(step in _state["errors"] for step in ESSENTIAL_STEPS)
+    _state["ready_s"] = round(time.time() - PROCESS_STARTED, 3)
+    _done.set()
+    logger.info(json.dumps({"event": "startup", **startup_report()}))
+
+def start_warmup(urls=None):
+    """Load the embedding model, default index, graph and chains in a background thread (idempotent)."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _state["started_at"] = time.time()
+            _thread = threading.Thread(target=_run, args=(urls,), name="rag-warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+def mark_interactive():
+    """Record when the process started accepting requests (time-to-interactive)."""
+    if _state["interactive_s"] is None:
+        _state["interactive_s"] = round(time.time() - PROCESS_STARTED, 3)
+        metrics.observe("rag_startup_interactive_seconds", _state["interactive_s"], help_text="Process start to accepting requests")
+
+def is_ready():
+    return _state["ready"]
+
+def wait_until_ready(timeout=None):
+    """Block until warm-up has finished (successfully or not); returns whether the process is ready."""
+    if _thread is None:
+        return _state["ready"]
+    _done.wait(timeout)
+    return _state["ready"]
+
+async def await_ready(timeout=None):
+    """Async wait_until_ready, for request handlers that should not race the warm-up."""
+    if _done.is_set() or _thread is None:
+        return _state["ready"]
+    return await asyncio.to_thread(wait_until_ready, timeout)
+
+def startup_report():
+    """Readiness, time-to-interactive, time-to-ready and per-step warm-up durations in seconds."""
+    return {
+        "ready": _state["ready"],
+        "warming_up": _thread is not None and not _done.is_set(),
+        "interactive_s": _state["interactive_s"],
+        "ready_s": _state["ready_s"],
+        "steps": dict(_state["steps"]),
+        "errors": dict(_state["errors"]),
+    }